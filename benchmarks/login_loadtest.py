@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+r"""
+    Load test for the Google login endpoint, WSGI (sync workers) vs ASGI.
+
+    USE FROM SERVER-WOUNDS ROOT DIRECTORY | as it depends on .env
+    The database from .env must be running (e.g. "python quickstart.py db").
+
+    A local stub replaces Google: it answers the token exchange and userinfo
+    calls after --google-latency seconds, so each login spends most of its
+    time waiting on "Google". The script then starts, one after the other:
+
+    - gunicorn citizens_project.wsgi with --wsgi-workers sync workers,
+      hit on POST /auth/google/
+    - uvicorn citizens_project.asgi with --asgi-workers workers,
+      hit on POST /auth/google/async/
+
+    and reports throughput and latency percentiles for each.
+
+    Example:
+    - python benchmarks/login_loadtest.py --concurrency 64 --duration 20
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import dotenv
+
+from loadtest_utils import report, run_load, wait_for_port
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PROJECT_DIR = ROOT_DIR / "citizens_project"
+
+
+class GoogleStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+
+    def _reply(self, body):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.latency)
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        # No id_token, so the server also calls userinfo: two round trips per login
+        self._reply({"access_token": "loadtest-token"})
+
+    def do_GET(self):
+        self._reply({"email": "loadtest.user@example.com", "name": "Load Test"})
+
+    def log_message(self, *args):
+        pass
+
+
+def start_google_stub(latency):
+    GoogleStub.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GoogleStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark(label, command, url, env, args):
+    process = subprocess.Popen(command, cwd=PROJECT_DIR, env=env)
+    try:
+        wait_for_port(f"http://127.0.0.1:{args.port}/docs/")
+
+        def send(session):
+            return session.post(url, json={"auth_code": "loadtest"}, timeout=60)
+
+        run_load(send, args.concurrency, 2)  # warm up pools and caches
+        latencies, errors = run_load(send, args.concurrency, args.duration)
+        report(label, latencies, errors, args.duration)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--google-latency", type=float, default=0.2)
+    parser.add_argument("--wsgi-workers", type=int, default=2)
+    parser.add_argument("--asgi-workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    dotenv.load_dotenv(ROOT_DIR / ".env")
+    stub = start_google_stub(args.google_latency)
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+
+    env = dict(os.environ)
+    env.update({
+        "GOOGLE_OAUTH2_TOKEN_URL": f"{stub_url}/token",
+        "GOOGLE_OAUTH2_USER_INFO_URL": f"{stub_url}/userinfo",
+        "ALLOWED_HOSTS": "127.0.0.1,localhost",
+        "DEBUG": "",
+    })
+    bind = f"127.0.0.1:{args.port}"
+    base_url = f"http://{bind}"
+
+    print(f"Google stub latency {args.google_latency * 1000:.0f} ms per call, "
+          f"{args.concurrency} concurrent clients, {args.duration:.0f} s per run")
+
+    benchmark(
+        f"WSGI ({args.wsgi_workers} sync workers)",
+        [sys.executable, "-m", "gunicorn", "citizens_project.wsgi:application",
+         "--bind", bind, "--workers", str(args.wsgi_workers), "--log-level", "warning"],
+        f"{base_url}/auth/google/", env, args,
+    )
+    benchmark(
+        f"ASGI ({args.asgi_workers} uvicorn workers)",
+        [sys.executable, "-m", "uvicorn", "citizens_project.asgi:application",
+         "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.asgi_workers), "--log-level", "warning"],
+        f"{base_url}/auth/google/async/", env, args,
+    )
+
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
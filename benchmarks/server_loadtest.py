@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+r"""
+    Load test of the main read endpoints under each gunicorn worker model.
+
+    USE FROM SERVER-WOUNDS ROOT DIRECTORY | as it depends on .env
+    The database from .env must be running and the comorbidities loaded.
+
+    For every worker model (GUNICORN_WORKER_CLASS: sync, gthread, uvicorn)
+    the server is started with docker/gunicorn.conf.py, so the other
+    GUNICORN_* variables from the environment apply too, and each endpoint is
+    hit by --concurrency clients for --duration seconds. A specialist user
+    ("loadtest.specialist@example.com") is created if needed to authenticate
+    the requests.
+
+    Example:
+    - python benchmarks/server_loadtest.py --models sync gthread uvicorn --concurrency 32
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import dotenv
+
+from loadtest_utils import report, run_load, wait_for_port
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PROJECT_DIR = ROOT_DIR / "citizens_project"
+GUNICORN_CONFIG = ROOT_DIR / "docker" / "gunicorn.conf.py"
+
+ENDPOINTS = [
+    "/auth/me/",
+    "/specialist/patients/",
+    "/wounds/",
+    "/comorbidities/search/?search=diab",
+]
+
+
+def create_access_token():
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "citizens_project.settings")
+    import django
+
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.db import connections
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from app_cicatrizando.models import Provider, WoundsUser
+
+    email = "loadtest.specialist@example.com"
+    user, _ = get_user_model().objects.get_or_create(
+        username=email, defaults={"email": email, "first_name": "Load", "last_name": "Test"},
+    )
+    wounds_user, _ = WoundsUser.objects.get_or_create(user=user, defaults={"role": WoundsUser.Provider})
+    Provider.objects.get_or_create(wounds_user=wounds_user, defaults={"professional_id": "LOADTEST"})
+    token = str(RefreshToken.for_user(user).access_token)
+
+    connections.close_all()
+    return token
+
+
+def benchmark(worker_model, env, token, args):
+    env = dict(env, GUNICORN_WORKER_CLASS=worker_model, GUNICORN_BIND=f"127.0.0.1:{args.port}")
+    if args.workers:
+        env["GUNICORN_WORKERS"] = str(args.workers)
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--config", str(GUNICORN_CONFIG), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        wait_for_port(f"{base_url}/docs/")
+        headers = {"Authorization": f"Bearer {token}"}
+
+        for endpoint in ENDPOINTS:
+            def send(session):
+                return session.get(f"{base_url}{endpoint}", headers=headers, timeout=60)
+
+            run_load(send, args.concurrency, 2)  # warm up pools and caches
+            latencies, errors = run_load(send, args.concurrency, args.duration)
+            report(f"{worker_model:<8} {endpoint}", latencies, errors, args.duration)
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["sync", "gthread", "uvicorn"])
+    parser.add_argument("--workers", type=int, help="Override the CPU-based default of each model")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    dotenv.load_dotenv(ROOT_DIR / ".env")
+    env = dict(os.environ, ALLOWED_HOSTS="127.0.0.1,localhost", DEBUG="")
+    token = create_access_token()
+
+    print(f"{args.concurrency} concurrent clients, {args.duration:.0f} s per endpoint")
+    for worker_model in args.models:
+        benchmark(worker_model, env, token, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
 
 
 class AppCicatrizandoConfig(AppConfig):
     name = 'app_cicatrizando'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .comorbidities import create_trigram_extension
+
+        pre_migrate.connect(create_trigram_extension, sender=self)
@@ -0,0 +1,217 @@
+"""
+Comorbidity (CID-11) search.
+
+The autocomplete only offers "macro" codes and matches the query anywhere in
+the name or code, ignoring case and accents ("ulcera" finds "Úlcera"). Both
+filters are served by indexes on PostgreSQL: the `is_macro` column replaces
+the `code NOT LIKE '%.%'` scan, and partial pg_trgm GIN indexes over the
+stored lower-cased, unaccented `name_normalized` / `code_normalized` columns
+serve the substring lookups.
+Matches are ranked by trigram similarity, so "diabetes" lists
+"Diabetes mellitus" before every disease that merely mentions it.
+
+The vocabulary only changes when load_comorbidities runs, so the search
+endpoint is normally served by `comorbidity_index`, an in-process index over
+the same rows and columns, rebuilt when the DatasetVersion stamp of the
+table changes. It returns exactly what `search_comorbidities` returns, so
+COMORBIDITY_SEARCH_IN_MEMORY only changes where the search runs.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+from .models import Comorbidity, DatasetVersion
+from .text import normalize_search_text
+
+WORD_RE = re.compile(r"\w+")
+
+# Same attributes as the model, so ComorbiditySerializer renders it unchanged
+ComorbidityEntry = namedtuple("ComorbidityEntry", ["concept_id", "code", "name"])
+
+# One immutable build of the index, replaced as a whole on rebuild
+_Snapshot = namedtuple("_Snapshot", ["entries", "by_code", "texts", "substrings", "trigram_ids", "entry_trigrams", "results"])
+
+# Ranked results kept per snapshot for repeated queries (keystrokes shared by users)
+RESULTS_CACHE_SIZE = 512
+
+
+def create_trigram_extension(sender, using, **kwargs):
+    """pre_migrate receiver: the trigram indexes need pg_trgm before the app's tables are created."""
+    conn = connections[using]
+    if conn.vendor != "postgresql":
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+
+def search_comorbidities(search_query=None):
+    """Macro comorbidities matching `search_query`, best matches first."""
+    queryset = Comorbidity.objects.filter(is_macro=True)
+    normalized = normalize_search_text(search_query).strip()
+    if not normalized:
+        return queryset.order_by("code")
+
+    return queryset.filter(
+        Q(name_normalized__contains=normalized) | Q(code_normalized__contains=normalized)
+    ).annotate(
+        similarity=Greatest(
+            TrigramSimilarity("name_normalized", normalized),
+            TrigramSimilarity("code_normalized", normalized),
+        )
+    ).order_by("-similarity", "code")
+
+
+def _trigrams(normalized):
+    # pg_trgm's definition: each word padded with two spaces before, one after
+    grams = set()
+    for word in WORD_RE.findall(normalized):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _substrings(text):
+    # Every 3 characters of the text as typed, unlike _trigrams' padded words
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _similarity(query_ids, query_size, grams):
+    # |Q & G| / |Q | G| with the entry's trigrams stored as a tuple of ids
+    common = len(query_ids.intersection(grams))
+    union = query_size + len(grams) - common
+    return common / union if union else 0.0
+
+
+class ComorbidityIndex:
+    """
+    Substring index over the macro comorbidities.
+
+    Like `search_comorbidities`, a search matches the entries whose
+    normalized name or code contains the normalized query, and ranks them by
+    trigram similarity, then code. Each 3-character substring of the names
+    and codes maps to the entries containing it; the entries having every
+    substring of the query are the only candidates checked for the whole
+    query. Queries shorter than that check every entry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = None
+        self._snapshot = _Snapshot([], [], [], {}, {}, [], OrderedDict())
+
+    def clear(self):
+        with self._lock:
+            self._stamp = None
+            self._checked_at = None
+
+    def _build(self):
+        entries, texts, entry_trigrams = [], [], []
+        substrings = {}
+        # Trigrams are stored as small ints shared by all entries to keep the index compact
+        trigram_ids = {}
+        rows = Comorbidity.objects.filter(is_macro=True).values_list(
+            "concept_id", "code", "name", "name_normalized", "code_normalized",
+        )
+        for position, (concept_id, code, name, name_normalized, code_normalized) in enumerate(rows.iterator()):
+            entry = ComorbidityEntry(concept_id, code, name)
+            name, code = name_normalized, code_normalized
+            entries.append(entry)
+            texts.append((name, code))
+            entry_trigrams.append(tuple(
+                tuple(trigram_ids.setdefault(gram, len(trigram_ids)) for gram in _trigrams(text))
+                for text in (name, code)
+            ))
+            for substring in _substrings(name) | _substrings(code):
+                substrings.setdefault(substring, []).append(position)
+
+        self._snapshot = _Snapshot(
+            entries=entries,
+            by_code=sorted(entries, key=lambda entry: entry.code),
+            texts=texts,
+            substrings=substrings,
+            trigram_ids=trigram_ids,
+            entry_trigrams=entry_trigrams,
+            results=OrderedDict(),
+        )
+
+    def _ensure_current(self):
+        # Consult the stamp at most every COMORBIDITY_INDEX_CHECK_INTERVAL seconds
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < settings.COMORBIDITY_INDEX_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < settings.COMORBIDITY_INDEX_CHECK_INTERVAL:
+                return
+            stamp = DatasetVersion.stamp(DatasetVersion.COMORBIDITIES)
+            if self._checked_at is None or stamp != self._stamp:
+                self._build()
+                self._stamp = stamp
+            self._checked_at = time.monotonic()
+
+    def search(self, search_query=None):
+        """List of ComorbidityEntry matching `search_query`, best matches first."""
+        self._ensure_current()
+        snapshot = self._snapshot
+
+        query = normalize_search_text(search_query).strip()
+        if not query:
+            return snapshot.by_code
+
+        results_cache = snapshot.results
+        try:
+            results = results_cache[query]
+        except KeyError:
+            pass
+        else:
+            return results
+
+        results = self._match(snapshot, query)
+        results_cache[query] = results
+        if len(results_cache) > RESULTS_CACHE_SIZE:
+            try:
+                results_cache.popitem(last=False)
+            except KeyError:
+                pass
+        return results
+
+    def _match(self, snapshot, query):
+        # Entries having every 3-character substring of the query: intersect
+        # their postings, shortest first
+        postings = sorted((snapshot.substrings.get(substring, ()) for substring in _substrings(query)), key=len)
+        if postings:
+            candidates = set(postings[0])
+            for positions in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(positions)
+        else:
+            candidates = range(len(snapshot.entries))
+
+        # The substrings may be spread over the text (or split between name
+        # and code); keep the entries that contain the whole query
+        texts = snapshot.texts
+        candidates = [position for position in candidates if query in texts[position][0] or query in texts[position][1]]
+
+        query_trigrams = _trigrams(query)
+        query_size = len(query_trigrams)
+        query_ids = {snapshot.trigram_ids[gram] for gram in query_trigrams if gram in snapshot.trigram_ids}
+        entries, entry_trigrams = snapshot.entries, snapshot.entry_trigrams
+
+        def rank(position):
+            name_grams, code_grams = entry_trigrams[position]
+            score = max(_similarity(query_ids, query_size, name_grams), _similarity(query_ids, query_size, code_grams))
+            return -score, entries[position].code
+
+        return [entries[position] for position in sorted(candidates, key=rank)]
+
+
+comorbidity_index = ComorbidityIndex()
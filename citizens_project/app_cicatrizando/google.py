@@ -2,35 +2,246 @@
 This module provides utility functions for authenticating users with Google OAuth2.
 
 It supports web-based authentication using the auth-code from @react-oauth/google:
-- Exchanges an authorization code for an access token to retrieve user data.
+- Exchanges an authorization code for tokens and reads the user data from the
+  returned ID token, verified locally against Google's cached signing keys.
+- Falls back to the userinfo endpoint when no ID token is returned.
 
 It integrates with Django settings for Google API client credentials and manages
 error reporting via Django REST Framework's `APIException`.
+
+All calls share one pooled `requests.Session` with keep-alive, connect/read
+timeouts and bounded retries with exponential backoff (GOOGLE_HTTP_* settings);
+the single-use auth code is never sent twice. A body that is not JSON (e.g. an
+HTML error page) is reported like any other Google error.
+The `async_*` functions implement the same flow on a pooled `httpx.AsyncClient`
+for the ASGI login view.
 """
 
 from django.conf import settings
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import APIException, AuthenticationFailed
+import asyncio
 import logging
+import re
+import threading
+import time
+import weakref
 from typing import Any, Dict
 
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from google.auth import exceptions as google_auth_exceptions
+from google.auth import jwt as google_jwt
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger("app_cicatrizando")
 
-GOOGLE_ACCESS_TOKEN_OBTAIN_URL = "https://oauth2.googleapis.com/token"
-GOOGLE_USER_INFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
+GOOGLE_ACCESS_TOKEN_OBTAIN_URL = settings.GOOGLE_OAUTH2_TOKEN_URL
+GOOGLE_USER_INFO_URL = settings.GOOGLE_OAUTH2_USER_INFO_URL
+# Google's ID token signing keys, keyed by "kid", as PEM certificates
+GOOGLE_CERTS_URL = settings.GOOGLE_OAUTH2_CERTS_URL
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+GOOGLE_RETRY_STATUSES = (502, 503, 504)
+# The token exchange POST spends the single-use auth code even when Google
+# answers with an error, so only GETs are retried on those statuses
+GOOGLE_RETRY_METHODS = frozenset({"GET"})
 
+_session = None
+# One AsyncClient per event loop, since a client cannot be shared across loops
+_async_clients = weakref.WeakKeyDictionary()
 
-def google_get_access_token(code: str, redirect_uri: str = "postmessage") -> str:
+
+def _build_session() -> requests.Session:
     """
-    Exchanges the authorization code for an access token.
-    
-    @react-oauth/google uses 'postmessage' as redirect_uri when the code
-    is obtained via popup or implicit flow.
-    
-    Ref: https://github.com/MomenSherif/react-oauth/issues/252
+    Create the session used for every Google call.
+
+    Connection failures, where nothing reached Google, are retried with
+    backoff, and so are 502/503/504 responses to GETs. A POST of the auth
+    code and read timeouts are not: Google may already have consumed the
+    single-use code, so a retry would fail with invalid_grant.
+    """
+    retries = Retry(
+        total=settings.GOOGLE_HTTP_RETRIES,
+        connect=settings.GOOGLE_HTTP_RETRIES,
+        read=0,
+        status=settings.GOOGLE_HTTP_RETRIES,
+        status_forcelist=GOOGLE_RETRY_STATUSES,
+        allowed_methods=GOOGLE_RETRY_METHODS,
+        backoff_factor=settings.GOOGLE_HTTP_BACKOFF_FACTOR,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.GOOGLE_HTTP_POOL_SIZE,
+        max_retries=retries,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _get_session() -> requests.Session:
+    """Return the module-level session, creating it on first use."""
+    global _session
+    if _session is None:
+        _session = _build_session()
+    return _session
+
+
+def _google_request(method: str, url: str, **kwargs) -> requests.Response:
+    timeout = (settings.GOOGLE_HTTP_CONNECT_TIMEOUT, settings.GOOGLE_HTTP_READ_TIMEOUT)
+    try:
+        return _get_session().request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        logger.error(f"Google request to {url} failed: {e}")
+        raise APIException("Could not reach Google, please try again")
+
+
+def _json(response, failure: str) -> Any:
+    """Decoded body of a Google response, or `failure` as an APIException when it is not JSON (e.g. an HTML error page)."""
+    try:
+        return response.json()
+    except ValueError:
+        logger.error(f"{failure}: status {response.status_code} with a non-JSON body")
+        raise APIException(failure)
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Return the AsyncClient of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.GOOGLE_HTTP_READ_TIMEOUT, connect=settings.GOOGLE_HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=settings.GOOGLE_HTTP_POOL_SIZE),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def _async_google_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Async counterpart of `_google_request`, with the same retry policy."""
+    client = _get_async_client()
+    for attempt in range(settings.GOOGLE_HTTP_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(settings.GOOGLE_HTTP_BACKOFF_FACTOR * (2 ** (attempt - 1)))
+        response = None
+        try:
+            response = await client.request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            error = e
+            continue
+        except httpx.HTTPError as e:
+            error = e
+            break
+        if response.status_code not in GOOGLE_RETRY_STATUSES or method not in GOOGLE_RETRY_METHODS:
+            return response
+
+    if response is not None:
+        # Retries exhausted on a retryable status; let the caller report it
+        return response
+    logger.error(f"Google request to {url} failed: {error}")
+    raise APIException("Could not reach Google, please try again")
+
+
+class GoogleCertsCache:
+    """
+    Process-wide cache of Google's ID token signing certificates.
+
+    Certificates are kept for the max-age Google sends with them. Once they
+    are within GOOGLE_CERTS_REFRESH_MARGIN seconds of expiring, the next
+    caller starts a background refresh and keeps using the cached set. Expired
+    certificates are evicted and fetched again before use.
     """
-    data = {
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._refreshing = False
+
+    def get(self, force_refresh: bool = False) -> Dict[str, str]:
+        now = time.monotonic()
+        if force_refresh or now >= self._expires_at:
+            with self._lock:
+                if force_refresh or time.monotonic() >= self._expires_at:
+                    self._certs = {}
+                    self._refresh()
+        elif now >= self._expires_at - settings.GOOGLE_CERTS_REFRESH_MARGIN and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+        return self._certs
+
+    def clear(self):
+        with self._lock:
+            self._certs = {}
+            self._expires_at = 0.0
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                self._refresh()
+        except APIException:
+            # Keep serving the cached certificates until they expire
+            pass
+        finally:
+            self._refreshing = False
+
+    def _refresh(self):
+        response = _google_request("GET", GOOGLE_CERTS_URL)
+        if not response.ok:
+            logger.error(f"Fetching Google certificates failed with status {response.status_code}")
+            raise APIException("Could not get signing keys from Google")
+
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        ttl = int(match.group(1)) if match else settings.GOOGLE_CERTS_DEFAULT_TTL
+        self._certs = _json(response, "Could not get signing keys from Google")
+        self._expires_at = time.monotonic() + ttl
+
+
+google_certs = GoogleCertsCache()
+
+
+def google_verify_id_token(id_token: str) -> Dict[str, Any]:
+    """
+    Verifies a Google ID token locally and returns its claims.
+
+    Checks the signature against the cached certificates, the expiry, the
+    audience (our client id) and the issuer. An unknown key id triggers one
+    forced refresh, to pick up keys Google has just rotated in.
+
+    Ref: https://developers.google.com/identity/openid-connect/openid-connect#validatinganidtoken
+    """
+    try:
+        kid = google_jwt.decode_header(id_token).get("kid")
+    except ValueError:
+        raise AuthenticationFailed("Malformed Google ID token")
+
+    certs = google_certs.get()
+    if kid not in certs:
+        certs = google_certs.get(force_refresh=True)
+
+    try:
+        claims = google_jwt.decode(
+            id_token,
+            certs=certs,
+            audience=settings.GOOGLE_OAUTH2_CLIENT_ID,
+            clock_skew_in_seconds=settings.GOOGLE_ID_TOKEN_CLOCK_SKEW,
+        )
+    except (ValueError, google_auth_exceptions.GoogleAuthError) as e:
+        logger.error(f"Google ID token verification failed: {e}")
+        raise AuthenticationFailed("Invalid Google ID token")
+
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise AuthenticationFailed("Invalid Google ID token issuer")
+
+    return claims
+
+
+def _token_request_data(code: str, redirect_uri: str) -> Dict[str, str]:
+    return {
         "code": code,
         "client_id": settings.GOOGLE_OAUTH2_CLIENT_ID,
         "client_secret": settings.GOOGLE_OAUTH2_CLIENT_SECRET,
@@ -38,14 +249,46 @@ def google_get_access_token(code: str, redirect_uri: str = "postmessage") -> str
         "grant_type": "authorization_code",
     }
 
-    response = requests.post(GOOGLE_ACCESS_TOKEN_OBTAIN_URL, data=data)
+
+def _standardize_user_info(user_info: Dict[str, Any]) -> Dict[str, Any]:
+    email = user_info.get("email")
+    if not email:
+        raise APIException("Google account does not have an email address")
+    
+    return {
+        "email": email,
+        "name": user_info.get("name", ""),
+        "given_name": user_info.get("given_name", ""),
+        "family_name": user_info.get("family_name", ""),
+        "sub": user_info.get("sub", ""),
+    }
+
+
+def google_exchange_code(code: str, redirect_uri: str = "postmessage") -> Dict[str, Any]:
+    """
+    Exchanges the authorization code for Google's token response
+    (access_token and, for the openid scope, id_token).
+    
+    @react-oauth/google uses 'postmessage' as redirect_uri when the code
+    is obtained via popup or implicit flow.
+    
+    Ref: https://github.com/MomenSherif/react-oauth/issues/252
+    """
+    data = _token_request_data(code, redirect_uri)
+
+    response = _google_request("POST", GOOGLE_ACCESS_TOKEN_OBTAIN_URL, data=data)
     
     if not response.ok:
-        error_detail = response.json()
+        error_detail = _json(response, "Could not get access token from Google")
         logger.error(f"Google token exchange failed: {error_detail}")
         raise APIException(f"Could not get access token from Google: {error_detail}")
 
-    return response.json()["access_token"]
+    return _json(response, "Could not get access token from Google")
+
+
+def google_get_access_token(code: str, redirect_uri: str = "postmessage") -> str:
+    """Exchanges the authorization code for an access token."""
+    return google_exchange_code(code=code, redirect_uri=redirect_uri)["access_token"]
 
 
 def google_get_user_info(access_token: str) -> Dict[str, Any]:
@@ -54,25 +297,27 @@ def google_get_user_info(access_token: str) -> Dict[str, Any]:
     
     Ref: https://developers.google.com/identity/protocols/oauth2/web-server#callinganapi
     """
-    response = requests.get(
+    response = _google_request(
+        "GET",
         GOOGLE_USER_INFO_URL,
         params={"access_token": access_token},
     )
 
     if not response.ok:
-        error_detail = response.json()
+        error_detail = _json(response, "Could not get user info from Google")
         logger.error(f"Google user info failed: {error_detail}")
         raise APIException(f"Could not get user info from Google: {error_detail}")
 
-    return response.json()
+    return _json(response, "Could not get user info from Google")
 
 
 def google_get_user_data(auth_code: str, redirect_uri: str = "postmessage") -> Dict[str, Any]:
     """
     Main function to authenticate user via auth-code from @react-oauth/google.
     
-    1. Exchanges the auth-code for an access token
-    2. Uses the access token to retrieve user information
+    1. Exchanges the auth-code for tokens
+    2. Verifies the ID token locally, or retrieves user information with the
+       access token when Google did not return an ID token
     3. Returns user data in a standardized format
     
     Args:
@@ -82,20 +327,64 @@ def google_get_user_data(auth_code: str, redirect_uri: str = "postmessage") -> D
     Returns:
         Dict with email, name, given_name, family_name and sub (Google user ID)
     """
-    logger.info("Exchanging auth code for access token")
-    access_token = google_get_access_token(code=auth_code, redirect_uri=redirect_uri)
+    logger.info("Exchanging auth code for tokens")
+    tokens = google_exchange_code(code=auth_code, redirect_uri=redirect_uri)
     
-    logger.info("Getting user info from Google")
-    user_info = google_get_user_info(access_token=access_token)
+    if tokens.get("id_token"):
+        logger.info("Verifying Google ID token")
+        user_info = google_verify_id_token(tokens["id_token"])
+    else:
+        logger.info("Getting user info from Google")
+        user_info = google_get_user_info(access_token=tokens["access_token"])
     
-    email = user_info.get("email")
-    if not email:
-        raise APIException("Google account does not have an email address")
-    
-    return {
-        "email": email,
-        "name": user_info.get("name", ""),
-        "given_name": user_info.get("given_name", ""),
-        "family_name": user_info.get("family_name", ""),
-        "sub": user_info.get("sub", ""),
-    }
+    return _standardize_user_info(user_info)
+
+
+async def async_google_exchange_code(code: str, redirect_uri: str = "postmessage") -> Dict[str, Any]:
+    """Async version of `google_exchange_code`."""
+    data = _token_request_data(code, redirect_uri)
+
+    response = await _async_google_request("POST", GOOGLE_ACCESS_TOKEN_OBTAIN_URL, data=data)
+
+    if not response.is_success:
+        error_detail = _json(response, "Could not get access token from Google")
+        logger.error(f"Google token exchange failed: {error_detail}")
+        raise APIException(f"Could not get access token from Google: {error_detail}")
+
+    return _json(response, "Could not get access token from Google")
+
+
+async def async_google_get_user_info(access_token: str) -> Dict[str, Any]:
+    """Async version of `google_get_user_info`."""
+    response = await _async_google_request(
+        "GET",
+        GOOGLE_USER_INFO_URL,
+        params={"access_token": access_token},
+    )
+
+    if not response.is_success:
+        error_detail = _json(response, "Could not get user info from Google")
+        logger.error(f"Google user info failed: {error_detail}")
+        raise APIException(f"Could not get user info from Google: {error_detail}")
+
+    return _json(response, "Could not get user info from Google")
+
+
+async def async_google_get_user_data(auth_code: str, redirect_uri: str = "postmessage") -> Dict[str, Any]:
+    """
+    Async version of `google_get_user_data`.
+
+    ID token verification runs in a worker thread because a certificate cache
+    miss fetches Google's keys with the blocking session.
+    """
+    logger.info("Exchanging auth code for tokens")
+    tokens = await async_google_exchange_code(code=auth_code, redirect_uri=redirect_uri)
+
+    if tokens.get("id_token"):
+        logger.info("Verifying Google ID token")
+        user_info = await sync_to_async(google_verify_id_token, thread_sensitive=False)(tokens["id_token"])
+    else:
+        logger.info("Getting user info from Google")
+        user_info = await async_google_get_user_info(access_token=tokens["access_token"])
+
+    return _standardize_user_info(user_info)
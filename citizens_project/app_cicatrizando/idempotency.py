@@ -0,0 +1,130 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+Mobile clients on poor networks retry a POST whose response they never got,
+which used to create the wound or observation (and upload its image) again.
+A client may send an Idempotency-Key header, unique per operation; the first
+successful response to a key is stored in an IdempotencyKey row and a retry
+with the same key gets that response back (with an Idempotent-Replayed
+header) without running the view again.
+
+- A key is scoped to the authenticated user. Reusing it for another method,
+  path or body is rejected with 422.
+- The first request runs in the transaction that reserves the key, so a
+  concurrent retry waits for it and then replays its response.
+- Only 2xx responses are stored; after an error the key can be retried.
+- Keys expire after IDEMPOTENCY_KEY_TTL seconds: expired rows are ignored,
+  replaced on reuse and deleted by the purge_idempotency_keys command.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=HEADER,
+    location=OpenApiParameter.HEADER,
+    required=False,
+    type=str,
+    description=(
+        "Unique key of this operation. Retrying with the same key returns the stored "
+        f"response instead of creating the resource again (kept for {settings.IDEMPOTENCY_KEY_TTL} seconds)."
+    ),
+)
+
+
+def _describe(value):
+    # Uploads are identified by name and size rather than by hashing their bytes
+    if isinstance(value, UploadedFile):
+        return {"name": value.name, "size": value.size}
+    return str(value)
+
+
+def request_fingerprint(request):
+    """SHA-256 of the method, path and parsed body of `request`."""
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    payload = json.dumps(
+        {"method": request.method, "path": request.path, "data": data}, sort_keys=True, default=_describe,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"error": f"This {HEADER} was already used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return Response(
+            {"error": f"A request with this {HEADER} is still being processed."},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(record.response, status=record.status_code, headers={"Idempotent-Replayed": "true"})
+
+
+def idempotent(view):
+    """
+    Make a POST handler of a viewset replay its stored response when retried
+    with the same Idempotency-Key. Requests without the header, and other
+    methods, run as before.
+    """
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER, "").strip()
+        if request.method != "POST" or not key:
+            return view(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        keys = IdempotencyKey.objects.filter(user=request.user, key=key)
+        now = timezone.now()
+        # A retry of a finished request is answered from this one row
+        record = keys.filter(expires_at__gt=now).first()
+        if record is not None:
+            return _replay(record, fingerprint)
+
+        with transaction.atomic():
+            keys.filter(expires_at__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user,
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+            except IntegrityError:
+                # A concurrent request with the key committed first
+                return _replay(keys.get(), fingerprint)
+
+            response = view(self, request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                record.status_code = response.status_code
+                record.response = response.data
+                record.save(update_fields=["status_code", "response"])
+            else:
+                record.delete()
+            return response
+
+    return wrapper
@@ -0,0 +1,176 @@
+"""
+Off-request processing of observation image uploads.
+
+Writing a multi-megabyte photo to object storage inside the upload request
+ties up a server worker for the whole transfer. Instead, the POST stages the
+upload on local disk (OBSERVATION_UPLOAD_STAGING_DIR), records an
+ObservationImageJob and answers right away with image_status "pending".
+The process_observation_images command claims jobs, normalizes the image
+(see images), renders its renditions, pushes everything to storage and marks
+the observation "ready" (or "failed" after OBSERVATION_IMAGE_JOB_MAX_ATTEMPTS
+attempts). With OBSERVATION_IMAGE_PROCESSING=inline the job is run right
+away inside the request instead.
+
+The staging directory must be shared by the server and the worker. Images
+uploaded straight to storage (see uploads) are queued by their storage key
+instead, and the worker replaces that raw object with the processed image.
+Uploads whose bytes were stored before are linked to that copy instead of
+being processed again (see image_store).
+"""
+
+import hashlib
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .image_store import acquire, link, sha256_of, store
+from .images import image_extension, normalize_upload
+from .models import ImageStatus, Observation, ObservationImageJob
+
+logger = logging.getLogger("app_cicatrizando")
+
+
+def stage_upload(observation, upload):
+    """
+    Stage the uploaded file `upload` of `observation` and queue it for the
+    worker. An image stored before is linked right away instead (no job).
+    """
+    os.makedirs(settings.OBSERVATION_UPLOAD_STAGING_DIR, exist_ok=True)
+    staged_path = os.path.join(settings.OBSERVATION_UPLOAD_STAGING_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    with open(staged_path, "wb") as staged:
+        for chunk in upload.chunks():
+            digest.update(chunk)
+            staged.write(chunk)
+
+    stored = acquire(digest.hexdigest())
+    if stored is not None:
+        os.remove(staged_path)
+        link(observation, stored)
+        return None
+
+    return _queue(
+        observation,
+        staged_path=staged_path,
+        sha256=digest.hexdigest(),
+        original_name=os.path.basename(upload.name or "image"),
+    )
+
+
+def queue_stored_upload(observation, key, original_name):
+    """Queue the image already uploaded to storage under `key` for `observation`."""
+    return _queue(observation, source_key=key, original_name=original_name)
+
+
+def _queue(observation, **job_fields):
+    Observation.objects.filter(pk=observation.pk).update(image_status=ImageStatus.PENDING)
+    observation.image_status = ImageStatus.PENDING
+    job = ObservationImageJob.objects.create(observation=observation, **job_fields)
+    if settings.OBSERVATION_IMAGE_PROCESSING != "background":
+        run_job(job, retry=False)
+    return job
+
+
+def _fail_abandoned(stale):
+    # Jobs whose every attempt was lost, e.g. an image that kills the worker
+    abandoned = ObservationImageJob.objects.select_for_update(skip_locked=True).filter(
+        status=ObservationImageJob.Status.PROCESSING,
+        started_at__lt=stale,
+        attempts__gte=settings.OBSERVATION_IMAGE_JOB_MAX_ATTEMPTS,
+    )
+    jobs = {job.pk: job.observation_id for job in abandoned.only("pk", "observation_id")}
+    if not jobs:
+        return
+    logger.error(f"Image jobs {sorted(jobs)} timed out on their last attempt")
+    ObservationImageJob.objects.filter(pk__in=jobs).update(
+        status=ObservationImageJob.Status.FAILED, last_error="Timed out: the worker processing it stopped",
+    )
+    Observation.objects.filter(pk__in=jobs.values()).update(image_status=ImageStatus.FAILED)
+
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` due jobs as processing and return them. Jobs left in
+    processing longer than OBSERVATION_IMAGE_JOB_TIMEOUT (a worker died) are
+    claimed again while they have attempts left, and marked failed otherwise.
+    Concurrent workers skip each other's locked rows.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.OBSERVATION_IMAGE_JOB_TIMEOUT)
+    due = Q(status=ObservationImageJob.Status.PENDING, available_at__lte=now) | Q(
+        status=ObservationImageJob.Status.PROCESSING,
+        started_at__lt=stale,
+        attempts__lt=settings.OBSERVATION_IMAGE_JOB_MAX_ATTEMPTS,
+    )
+    with transaction.atomic():
+        _fail_abandoned(stale)
+        jobs = list(
+            ObservationImageJob.objects.select_for_update(skip_locked=True).filter(due).order_by("available_at")[:limit]
+        )
+        ObservationImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ObservationImageJob.Status.PROCESSING, started_at=now, attempts=F("attempts") + 1,
+        )
+    for job in jobs:
+        job.status = ObservationImageJob.Status.PROCESSING
+        job.started_at = now
+        job.attempts += 1
+    return jobs
+
+
+def _process(job):
+    # The observation instance of the request when run inline
+    observation = job.observation
+    if job.source_key:
+        source = default_storage.open(job.source_key, "rb")
+    else:
+        source = open(job.staged_path, "rb")
+    with source:
+        # Client-provided hashes are never trusted for storing
+        sha256 = job.sha256 or sha256_of(source)
+        stored = acquire(sha256)
+        if stored is None:
+            stored = store(sha256, normalize_upload(source), image_extension())
+
+    link(observation, stored)
+    if job.source_key:
+        default_storage.delete(job.source_key)
+
+
+def _fail(job, error, retry):
+    if retry and job.attempts < settings.OBSERVATION_IMAGE_JOB_MAX_ATTEMPTS:
+        retry_at = timezone.now() + timedelta(seconds=settings.OBSERVATION_IMAGE_JOB_RETRY_DELAY * job.attempts)
+        ObservationImageJob.objects.filter(pk=job.pk).update(
+            status=ObservationImageJob.Status.PENDING, available_at=retry_at, last_error=error,
+        )
+        return
+
+    ObservationImageJob.objects.filter(pk=job.pk).update(status=ObservationImageJob.Status.FAILED, last_error=error)
+    Observation.objects.filter(pk=job.observation_id).update(image_status=ImageStatus.FAILED)
+    if ObservationImageJob.observation.is_cached(job):
+        job.observation.image_status = ImageStatus.FAILED
+
+
+def run_job(job, retry=True):
+    """
+    Process a claimed job; returns whether the image is now stored. A failed
+    job is queued again unless `retry` is False or it used all its attempts.
+    """
+    try:
+        _process(job)
+    except Observation.DoesNotExist:
+        # Deleted while queued; its job (and staged file) went with it
+        return False
+    except Exception as e:
+        logger.exception(f"Processing image job {job.pk} of observation {job.observation_id} failed")
+        _fail(job, f"{type(e).__name__}: {e}", retry)
+        return False
+
+    job.delete()
+    return True
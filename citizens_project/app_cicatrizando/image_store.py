@@ -0,0 +1,107 @@
+"""
+Content-addressed storage of observation images.
+
+Clients retry uploads that timed out, so the same photo often arrives several
+times. Each normalized image is stored once, under observations/<sha256> keys
+derived from the uploaded bytes, and recorded in a StoredImage row that
+counts the observations using it. A known hash is linked instead of being
+normalized and uploaded again: while an upload is staged, by the worker, and
+before a direct upload (the client sends the hash when asking for the URL).
+Deleting the last observation of a StoredImage deletes its files.
+
+Identical uploads keep the normalization settings of their first ingest.
+"""
+
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import ImageStatus, StoredImage
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_of(source):
+    """Hex SHA-256 of the file `source`, read from its start and rewound."""
+    source.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def acquire(sha256):
+    """Take a reference to the StoredImage of `sha256`; None if it is not stored."""
+    if not sha256:
+        return None
+    # An atomic increment; a concurrent release of the last reference either
+    # commits first (no row left) or sees the new count
+    if not StoredImage.objects.filter(sha256=sha256).update(refcount=F("refcount") + 1):
+        return None
+    return StoredImage.objects.filter(sha256=sha256).first()
+
+
+def store(sha256, normalized, extension):
+    """Store a normalized upload under keys derived from `sha256` and return its StoredImage."""
+    name = default_storage.save(f"observations/{sha256}.{extension}", ContentFile(normalized.content))
+    renditions = {
+        rendition: default_storage.save(f"observations/{sha256}_{rendition}.{extension}", ContentFile(content))
+        for rendition, content in normalized.renditions.items()
+    }
+    try:
+        with transaction.atomic():
+            return StoredImage.objects.create(
+                sha256=sha256,
+                name=name,
+                renditions=renditions,
+                original_bytes=normalized.original_bytes,
+                stored_bytes=len(normalized.content),
+            )
+    except IntegrityError:
+        # Another worker stored the same bytes meanwhile; use its copy
+        stored = acquire(sha256)
+        if stored is None:
+            raise
+        _delete_files([name, *renditions.values()])
+        return stored
+
+
+def link(observation, stored):
+    """Point `observation` at the files of `stored` (already acquired for it)."""
+    values = {
+        "image": stored.name,
+        "image_renditions_source": stored.name,
+        "image_status": ImageStatus.READY,
+        "image_original_bytes": stored.original_bytes,
+        "image_stored_bytes": stored.stored_bytes,
+        "image_source": stored,
+    }
+    for rendition, name in stored.renditions.items():
+        values[f"image_{rendition}"] = name
+    for field, value in values.items():
+        setattr(observation, field, value)
+    # Without save(), so the rendition signal does not run
+    type(observation).objects.filter(pk=observation.pk).update(**values)
+
+
+def release(stored_image_id):
+    """Drop a reference to a StoredImage, deleting it and its files with the last one."""
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(pk=stored_image_id).first()
+        if stored is None:
+            return
+        if stored.refcount > 1:
+            StoredImage.objects.filter(pk=stored.pk).update(refcount=F("refcount") - 1)
+            return
+        stored.delete()
+        names = [stored.name, *stored.renditions.values()]
+        transaction.on_commit(lambda: _delete_files(names))
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
@@ -0,0 +1,165 @@
+"""
+Observation image normalization and renditions.
+
+Observation photos come straight from phone cameras: full sensor resolution,
+any format, EXIF blobs with the GPS position. On ingest (see image_jobs) each
+upload is normalized: rotated upright from its EXIF orientation, downscaled
+to OBSERVATION_IMAGE_MAX_DIMENSION, stripped of metadata
+(OBSERVATION_IMAGE_STRIP_METADATA) and re-encoded as OBSERVATION_IMAGE_FORMAT
+(JPEG or WEBP) at OBSERVATION_IMAGE_QUALITY. The sizes before and after are
+recorded on the observation.
+
+Lists and timelines only show small previews, so every observation image
+also gets a thumbnail and a medium rendition whose longest side is bounded
+by OBSERVATION_IMAGE_RENDITIONS, stored next to the original in
+STORAGES["default"]. Images set any other way (admin, shell) are only
+rendered, from storage, when saved.
+"""
+
+import logging
+import os
+from collections import namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .image_store import release
+from .models import ImageStatus, Observation
+
+logger = logging.getLogger("app_cicatrizando")
+
+# What decoding or encoding a broken or hostile upload can raise
+IMAGE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+# The stored image bytes, its renditions and the size of the upload
+NormalizedImage = namedtuple("NormalizedImage", ["content", "renditions", "original_bytes"])
+
+
+def rendition_fields():
+    """Observation field of each configured rendition ("thumbnail" -> "image_thumbnail")."""
+    return {name: f"image_{name}" for name in settings.OBSERVATION_IMAGE_RENDITIONS}
+
+
+def image_extension():
+    return EXTENSIONS[settings.OBSERVATION_IMAGE_FORMAT]
+
+
+def _load(source, max_size=None):
+    with Image.open(source) as image:
+        if max_size:
+            # JPEG only decodes at the scale needed for max_size
+            image.draft("RGB", (max_size, max_size))
+        # Applies and drops the EXIF orientation, so phones' sideways photos display upright
+        image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+        # A profile of the source color space no longer applies
+        image.info.pop("icc_profile", None)
+    if max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    return image
+
+
+def _encode(image, quality, metadata=None):
+    output = BytesIO()
+    image_format = settings.OBSERVATION_IMAGE_FORMAT
+    if image_format == "WEBP":
+        image.save(output, image_format, quality=quality, method=4, **(metadata or {}))
+    else:
+        image.save(output, image_format, quality=quality, optimize=True, **(metadata or {}))
+    return output.getvalue()
+
+
+def _metadata(image):
+    if settings.OBSERVATION_IMAGE_STRIP_METADATA:
+        return {}
+    metadata = {"exif": image.getexif().tobytes()}
+    if image.info.get("icc_profile"):
+        metadata["icc_profile"] = image.info["icc_profile"]
+    return metadata
+
+
+def _render(image):
+    renditions = {}
+    for name, max_size in settings.OBSERVATION_IMAGE_RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        renditions[name] = _encode(rendition, settings.OBSERVATION_RENDITION_QUALITY)
+    return renditions
+
+
+def render_renditions(source):
+    """Return the encoded bytes of each configured rendition of the image file `source`."""
+    return _render(_load(source, max(settings.OBSERVATION_IMAGE_RENDITIONS.values())))
+
+
+def normalize_upload(source):
+    """Normalize the uploaded image file `source` and render its renditions."""
+    source.seek(0, os.SEEK_END)
+    original_bytes = source.tell()
+    source.seek(0)
+
+    image = _load(source, settings.OBSERVATION_IMAGE_MAX_DIMENSION or None)
+    content = _encode(image, settings.OBSERVATION_IMAGE_QUALITY, _metadata(image))
+    return NormalizedImage(content, _render(image), original_bytes)
+
+
+def store_renditions(observation, renditions, **values):
+    """
+    Replace the stored renditions of `observation` with `renditions` and save
+    them together with the extra field `values`. The row is updated without
+    save() so no save signal fires again.
+    """
+    fields = rendition_fields()
+    for field in fields.values():
+        rendition = getattr(observation, field)
+        # Files of a StoredImage are shared and deleted by image_store.release
+        if rendition and not observation.image_source_id:
+            rendition.delete(save=False)
+        values[field] = None
+
+    stem = os.path.splitext(os.path.basename(observation.image.name or ""))[0]
+    for name, content in renditions.items():
+        rendition = getattr(observation, fields[name])
+        rendition.save(f"{stem}_{name}.{image_extension()}", ContentFile(content), save=False)
+        values[fields[name]] = rendition.name
+
+    values["image_renditions_source"] = observation.image.name or ""
+    for field, value in values.items():
+        setattr(observation, field, value)
+    Observation.objects.filter(pk=observation.pk).update(**values)
+
+
+def _clear_renditions(observation):
+    values = {field: None for field in rendition_fields().values()}
+    values["image_source"] = None
+    for field, value in values.items():
+        setattr(observation, field, value)
+    Observation.objects.filter(pk=observation.pk).update(**values)
+
+
+def generate_renditions(observation):
+    """Render and store the renditions of the image already stored in `observation.image`."""
+    if observation.image_source_id:
+        # The image was replaced; these renditions are no longer its own
+        previous_source = observation.image_source_id
+        _clear_renditions(observation)
+        release(previous_source)
+
+    if not observation.image:
+        store_renditions(observation, {}, image_status=ImageStatus.NONE)
+        return
+
+    try:
+        with observation.image.open("rb") as source:
+            renditions = render_renditions(source)
+    except IMAGE_ERRORS as e:
+        # Leave the renditions empty; the original image is still served
+        logger.error(f"Rendering observation {observation.pk} image {observation.image.name} failed: {e}")
+        store_renditions(observation, {}, image_status=ImageStatus.FAILED)
+        return
+    store_renditions(observation, renditions, image_status=ImageStatus.READY)
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Q
+
+from app_cicatrizando.models import Patient, Provider, WoundsUser
+from app_cicatrizando.profile_cache import invalidate_me_profiles
+
+
+class Command(BaseCommand):
+    help = 'Recomputes WoundsUser.registration_complete for every user with set-based queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many users would change',
+        )
+
+    def handle(self, *args, **options):
+        # Same rules as WoundsUser.compute_registration_complete, evaluated in SQL
+        users = WoundsUser.objects.annotate(
+            has_provider=Exists(Provider.objects.filter(wounds_user=OuterRef('pk'), professional_id__isnull=False)),
+            has_assigned_patient=Exists(Patient.objects.filter(wounds_user=OuterRef('pk'), assigned_providers__isnull=False)),
+        )
+        complete = (
+            Q(birth_date__isnull=False) & ~Q(state='') & ~Q(city='') & (
+                Q(role=WoundsUser.Provider, has_provider=True) |
+                Q(role=WoundsUser.Patient, has_assigned_patient=True)
+            )
+        )
+
+        to_complete = users.filter(complete, registration_complete=False)
+        to_incomplete = users.filter(~complete, registration_complete=True)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.NOTICE(
+                f'{to_complete.count()} users would be marked complete, '
+                f'{to_incomplete.count()} users would be marked incomplete.'
+            ))
+            return
+
+        completed_ids = list(to_complete.values_list('pk', 'user_id'))
+        uncompleted_ids = list(to_incomplete.values_list('pk', 'user_id'))
+
+        # Filter by pk so the UPDATE does not need the annotations
+        completed = WoundsUser.objects.filter(pk__in=[pk for pk, _ in completed_ids]).update(registration_complete=True)
+        uncompleted = WoundsUser.objects.filter(pk__in=[pk for pk, _ in uncompleted_ids]).update(registration_complete=False)
+
+        # update() sends no signals, so drop the cached /auth/me profiles here
+        invalidate_me_profiles([user_id for _, user_id in completed_ids + uncompleted_ids])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Marked {completed} users complete and {uncompleted} users incomplete.'
+        ))
@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from app_cicatrizando.comorbidities import comorbidity_index, search_comorbidities
+from app_cicatrizando.models import Comorbidity
+
+# Autocomplete keystrokes: short prefixes are the worst case for a LIKE scan
+DEFAULT_QUERIES = ['d', 'di', 'dia', 'diab', 'diabetes', 'hiper', 'hipertensão', 'insuf', 'neopl', 'tuberc', '5A', 'BA0']
+
+
+def legacy_search(search_query):
+    # The search before is_macro and the trigram indexes, kept for comparison
+    queryset = Comorbidity.objects.filter(code__isnull=False).exclude(code__contains='.')
+    return queryset.filter(Q(name__icontains=search_query) | Q(code__icontains=search_query))
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures /comorbidities/search/ queries (first page + count, as the view paginates) '
+        'against the loaded CID-11 table: the original scan, the trigram indexes and the in-memory index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries',
+            nargs='*',
+            help='Search terms (defaults to a set of autocomplete prefixes)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print the query plan of the indexed search for each term',
+        )
+
+    def _measure(self, queryset, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            queryset.count()
+            list(queryset[:20])
+            timings.append(time.perf_counter() - started)
+        return self._percentiles(timings)
+
+    def _measure_index(self, search_query, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            results = comorbidity_index.search(search_query)
+            len(results)
+            results[:20]
+            timings.append(time.perf_counter() - started)
+        return self._percentiles(timings)
+
+    def _percentiles(self, timings):
+        timings.sort()
+        return timings[max(0, int(len(timings) * 0.95) - 1)], statistics.median(timings)
+
+    def handle(self, *args, **options):
+        total = Comorbidity.objects.count()
+        if not total:
+            raise CommandError('Comorbidity table is empty. Run load_comorbidities first.')
+
+        queries = options['queries'] or DEFAULT_QUERIES
+        iterations = options['iterations']
+
+        self.stdout.write(self.style.NOTICE(f'{total} comorbidities, {iterations} iterations per query'))
+        self.stdout.write(
+            f'{"query":<14} {"matches":>8} {"legacy p95":>12} {"trigram p95":>12} {"trigram p50":>12} {"memory p95":>12}'
+        )
+        comorbidity_index.search('')  # build the index outside the measurements
+
+        for search_query in queries:
+            legacy_p95, _ = self._measure(legacy_search(search_query), iterations)
+            queryset = search_comorbidities(search_query)
+            trigram_p95, trigram_p50 = self._measure(queryset, iterations)
+            memory_p95, _ = self._measure_index(search_query, iterations)
+            self.stdout.write(
+                f'{search_query:<14} {queryset.count():>8} {legacy_p95 * 1000:>9.2f} ms '
+                f'{trigram_p95 * 1000:>9.2f} ms {trigram_p50 * 1000:>9.2f} ms {memory_p95 * 1000:>9.3f} ms'
+            )
+            if options['explain']:
+                self.stdout.write(queryset[:20].explain())
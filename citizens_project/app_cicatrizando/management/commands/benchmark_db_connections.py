@@ -0,0 +1,77 @@
+import statistics
+import time
+
+import psycopg
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the database cost of a request cycle with the configured connection '
+        'mode (SERVER_WOUNDS_DB_CONNECTION_MODE) against opening a new connection per request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+        )
+        parser.add_argument(
+            '--query',
+            type=str,
+            default='SELECT 1',
+            help='Statement executed once per simulated request',
+        )
+
+    def _fresh_connection(self, query):
+        # What every request paid before connection reuse: connect, query, close
+        params = connection.get_connection_params()
+        started = time.perf_counter()
+        with psycopg.connect(**params) as conn:
+            conn.execute(query)
+        return time.perf_counter() - started
+
+    def _configured_request(self, query):
+        # Django's handler sends these signals around every request; they open
+        # and release connections according to CONN_MAX_AGE or the pool
+        started = time.perf_counter()
+        request_started.send(sender=self.__class__)
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+        request_finished.send(sender=self.__class__)
+        return time.perf_counter() - started
+
+    def _report(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        self.stdout.write(
+            f'{label:<12} mean {statistics.mean(timings) * 1000:8.3f} ms  '
+            f'p50 {statistics.median(timings) * 1000:8.3f} ms  p95 {p95 * 1000:8.3f} ms'
+        )
+        return statistics.mean(timings)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        query = options['query']
+
+        # Warm up both paths so one-off costs (pool start, DNS) are not counted
+        self._fresh_connection(query)
+        self._configured_request(query)
+
+        fresh = [self._fresh_connection(query) for _ in range(iterations)]
+        configured = [self._configured_request(query) for _ in range(iterations)]
+
+        self.stdout.write(self.style.NOTICE(
+            f'{iterations} simulated requests, connection mode: {settings.DB_CONNECTION_MODE}'
+        ))
+        fresh_mean = self._report('new conn', fresh)
+        configured_mean = self._report('configured', configured)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {(fresh_mean - configured_mean) * 1000:.3f} ms per request '
+            f'({fresh_mean / configured_mean:.1f}x faster)'
+        ))
@@ -0,0 +1,98 @@
+import itertools
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from app_cicatrizando.images import IMAGE_ERRORS, normalize_upload
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.bmp')
+
+
+class Command(BaseCommand):
+    help = (
+        'Normalizes every image of a directory as observation uploads are normalized and reports, '
+        'per format / quality / max dimension, the bytes saved and the CPU time spent. Nothing is stored.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory of sample images (searched recursively)')
+        parser.add_argument(
+            '--formats',
+            nargs='+',
+            default=[settings.OBSERVATION_IMAGE_FORMAT],
+            choices=['JPEG', 'WEBP'],
+        )
+        parser.add_argument(
+            '--qualities',
+            nargs='+',
+            type=int,
+            default=[settings.OBSERVATION_IMAGE_QUALITY],
+        )
+        parser.add_argument(
+            '--max-dimensions',
+            nargs='+',
+            type=int,
+            default=[settings.OBSERVATION_IMAGE_MAX_DIMENSION],
+            help='0 keeps the original resolution',
+        )
+
+    def _images(self, directory):
+        paths = []
+        for root, _, files in os.walk(directory):
+            paths += [os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS)]
+        return sorted(paths)
+
+    def _run(self, paths):
+        original_bytes = stored_bytes = rendition_bytes = 0
+        cpu_times = []
+        failed = 0
+        for path in paths:
+            with open(path, 'rb') as source:
+                started = time.process_time()
+                try:
+                    normalized = normalize_upload(source)
+                except IMAGE_ERRORS as e:
+                    self.stderr.write(f'{path}: {e}')
+                    failed += 1
+                    continue
+                cpu_times.append(time.process_time() - started)
+            original_bytes += normalized.original_bytes
+            stored_bytes += len(normalized.content)
+            rendition_bytes += sum(len(content) for content in normalized.renditions.values())
+        return original_bytes, stored_bytes, rendition_bytes, cpu_times, failed
+
+    def handle(self, *args, **options):
+        paths = self._images(options['directory'])
+        if not paths:
+            raise CommandError(f'No images found in {options["directory"]}.')
+
+        self.stdout.write(self.style.NOTICE(f'{len(paths)} images, strip metadata: {settings.OBSERVATION_IMAGE_STRIP_METADATA}'))
+        self.stdout.write(
+            f'{"format":<6} {"quality":>7} {"max dim":>8} {"original":>11} {"stored":>11} {"saved":>7} '
+            f'{"renditions":>11} {"cpu p50":>10} {"cpu p95":>10} {"cpu total":>10}'
+        )
+        configurations = itertools.product(options['formats'], options['qualities'], options['max_dimensions'])
+        for image_format, quality, max_dimension in configurations:
+            # normalize_upload reads its parameters from the settings
+            with override_settings(
+                OBSERVATION_IMAGE_FORMAT=image_format,
+                OBSERVATION_IMAGE_QUALITY=quality,
+                OBSERVATION_IMAGE_MAX_DIMENSION=max_dimension,
+            ):
+                original_bytes, stored_bytes, rendition_bytes, cpu_times, failed = self._run(paths)
+            if not cpu_times:
+                raise CommandError('No image could be decoded.')
+
+            cpu_times.sort()
+            p95 = cpu_times[max(0, int(len(cpu_times) * 0.95) - 1)]
+            saved = 1 - stored_bytes / original_bytes if original_bytes else 0
+            self.stdout.write(
+                f'{image_format:<6} {quality:>7} {max_dimension or "-":>8} {original_bytes / 1e6:>8.2f} MB '
+                f'{stored_bytes / 1e6:>8.2f} MB {saved:>7.1%} {rendition_bytes / 1e6:>8.2f} MB '
+                f'{statistics.median(cpu_times) * 1000:>7.1f} ms {p95 * 1000:>7.1f} ms {sum(cpu_times):>9.2f}s'
+                + (f'  ({failed} failed)' if failed else '')
+            )
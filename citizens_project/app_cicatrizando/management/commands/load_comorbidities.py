@@ -1,9 +1,13 @@
 import csv
+import hashlib
 import os
 import re
+import time
 
-from app_cicatrizando.models import Comorbidity
+from app_cicatrizando.models import Comorbidity, DatasetVersion, Patient
+from app_cicatrizando.profile_cache import invalidate_me_profiles
 from django.conf import settings
+from django.db import connection, transaction
 
 from django.core.management.base import BaseCommand
 
@@ -12,6 +16,13 @@ comorbidity_max_name_length = Comorbidity._meta.get_field("name").max_length
 
 ### This script is populating the database with ICD-11, and not with OMOP CDM.
 
+# The concept id is the last number of the linearization URI
+CONCEPT_ID_RE = re.compile(r'(\d+)\D*$')
+
+COLUMNS = ('concept_id', 'code', 'name', 'is_macro', 'name_normalized', 'code_normalized')
+# Always qualified with pg_temp, so no statement can reach a regular table of that name
+STAGING_TABLE = 'pg_temp.comorbidity_staging'
+
 
 class Command(BaseCommand):
     'Populates the Comorbidity database with contents from comorbidities_ICD11.csv'
@@ -29,46 +40,38 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Repopulate comorbidities even if the table already has records. Use when new comorbidities need to be added',
+            help='Sync the table even if the CSV checksum matches the last sync',
+        )
+        parser.add_argument(
+            '--loader',
+            choices=['auto', 'copy', 'orm'],
+            default='auto',
+            help='copy: stream rows into a PostgreSQL staging table with COPY and apply the diff in SQL '
+                 '(default on PostgreSQL); orm: compute the diff in Python and apply it in batches',
         )
 
-    def handle(self, *args, **options):
-        file_path = options['file']
-        force = options['force']
-        if not os.path.isabs(file_path):
-            file_path = os.path.join(settings.BASE_DIR.parent, file_path)
-
-        if not os.path.exists(file_path):
-            self.stdout.write(self.style.ERROR(f'File not found at {file_path}'))
-            return
-
-        if Comorbidity.objects.exists() and not force:
-            self.stdout.write(self.style.WARNING('Comorbidity table already has records. Skipping population.'))
-            return
-
-        if Comorbidity.objects.exists() and force:
-            self.stdout.write(self.style.WARNING('Repopulating comorbidities table.'))
-            Comorbidity.objects.all().delete()
+    def _checksum(self, file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
 
-        self.stdout.write(self.style.NOTICE('Starting population of comorbidities...'))
-        
-        batch_size = 5000
-        objs = []
+    def _read_rows(self, file_path):
+        """Yield (concept_id, code, name) for each distinct concept in the CSV."""
         seen_ids = set()
 
-        with open(file_path, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            
-            for row in reader:
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
                 lin_uri = row.get('Linearization URI', '').strip()
                 if not lin_uri:
                     continue
-                    
-                concept_matches = re.findall(r'(\d+)', lin_uri)
-                if not concept_matches:
+
+                concept_match = CONCEPT_ID_RE.search(lin_uri)
+                if not concept_match:
                     continue
-                concept_id = concept_matches[-1]
-                
+                concept_id = concept_match.group(1)
+
                 if concept_id in seen_ids:
                     continue
                 seen_ids.add(concept_id)
@@ -76,21 +79,160 @@ class Command(BaseCommand):
                 title = row.get('Title', '').strip()
                 if not title:
                     title = row.get('TitleEN', '').strip()
-                    
+
                 # Remove leading dashes and spaces
-                title = title.lstrip('- ')
-                title = title[:255]
-                
+                title = title.lstrip('- ')[:comorbidity_max_name_length]
+
                 code = row.get('Code', '').strip() or None
-                
-                objs.append(Comorbidity(concept_id=concept_id, code=code, name=title))
-                
-                if len(objs) >= batch_size:
-                    Comorbidity.objects.bulk_create(objs, ignore_conflicts=True)
-                    self.stdout.write(self.style.SUCCESS(f'Processed {len(seen_ids)} records...'))
-                    objs = []
-                    
-            if objs:
-                Comorbidity.objects.bulk_create(objs, ignore_conflicts=True)
-                
+
+                yield concept_id, code, title
+
+    def _invalidate_profiles(self, concept_ids, batch_size):
+        """
+        Drop, once the sync commits, the cached /auth/me profiles that embed
+        any of these comorbidities: bulk writes and deletes send no signals.
+        Must run before their patient links are deleted.
+        """
+        links = Patient.comorbidities.through.objects
+        user_ids = set()
+        for start in range(0, len(concept_ids), batch_size):
+            batch = concept_ids[start:start + batch_size]
+            user_ids.update(
+                links.filter(comorbidity_id__in=batch).values_list('patient__wounds_user__user_id', flat=True)
+            )
+        if user_ids:
+            transaction.on_commit(lambda: invalidate_me_profiles(user_ids))
+
+    def _delete(self, concept_ids, batch_size):
+        # Through the ORM so the patient links of removed rows are deleted too
+        deleted = 0
+        for start in range(0, len(concept_ids), batch_size):
+            batch = concept_ids[start:start + batch_size]
+            deleted += Comorbidity.objects.filter(pk__in=batch).delete()[1].get(Comorbidity._meta.label, 0)
+        return deleted
+
+    def _sync_with_copy(self, rows, batch_size=5000):
+        """
+        Stream the rows into a temporary staging table with COPY, then apply
+        the diff in SQL: one upsert that only writes new and changed rows,
+        and a delete of the rows missing from the CSV.
+        """
+        table = connection.ops.quote_name(Comorbidity._meta.db_table)
+        columns = ', '.join(COLUMNS)
+        updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in COLUMNS[1:])
+        changed = ' OR '.join(f'{table}.{column} IS DISTINCT FROM EXCLUDED.{column}' for column in COLUMNS[1:])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # ON COMMIT DROP only fires at the outermost commit
+            cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+            cursor.execute(f'CREATE TEMPORARY TABLE {STAGING_TABLE} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+            loaded = 0
+            with cursor.copy(f'COPY {STAGING_TABLE} ({columns}) FROM STDIN') as copy:
+                for concept_id, code, name in rows:
+                    copy.write_row((concept_id, code, name, *Comorbidity.derived_values(code, name)))
+                    loaded += 1
+
+            # xmax is 0 for freshly inserted rows and set for updated ones
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {STAGING_TABLE} '
+                f'ON CONFLICT (concept_id) DO UPDATE SET {updates} WHERE {changed} '
+                'RETURNING concept_id, (xmax = 0)'
+            )
+            written = cursor.fetchall()
+            updated_ids = [concept_id for concept_id, inserted in written if not inserted]
+
+            cursor.execute(
+                f'SELECT concept_id FROM {table} t WHERE NOT EXISTS '
+                f'(SELECT 1 FROM {STAGING_TABLE} s WHERE s.concept_id = t.concept_id)'
+            )
+            removed_ids = [concept_id for concept_id, in cursor.fetchall()]
+            self._invalidate_profiles(updated_ids + removed_ids, batch_size)
+            deleted = self._delete(removed_ids, batch_size)
+
+        return loaded, len(written) - len(updated_ids), len(updated_ids), deleted
+
+    def _sync_with_orm(self, rows, batch_size=5000):
+        """Diff the rows against the table in Python and apply inserts, updates and deletes in batches."""
+        fields = COLUMNS[1:]
+        existing = {
+            concept_id: tuple(values)
+            for concept_id, *values in Comorbidity.objects.values_list(*COLUMNS).iterator(chunk_size=batch_size)
+        }
+
+        loaded = inserted = 0
+        to_create, to_update, updated_ids = [], [], []
+
+        def flush():
+            Comorbidity.objects.bulk_create(to_create, batch_size=batch_size)
+            Comorbidity.objects.bulk_update(to_update, fields, batch_size=batch_size)
+            to_create.clear()
+            to_update.clear()
+
+        with transaction.atomic():
+            for concept_id, code, name in rows:
+                loaded += 1
+                values = (code, name, *Comorbidity.derived_values(code, name))
+                current = existing.pop(concept_id, None)
+                if current == values:
+                    continue
+
+                comorbidity = Comorbidity(concept_id=concept_id, **dict(zip(fields, values)))
+                if current is None:
+                    to_create.append(comorbidity)
+                    inserted += 1
+                else:
+                    to_update.append(comorbidity)
+                    updated_ids.append(concept_id)
+
+                if len(to_create) + len(to_update) >= batch_size:
+                    flush()
+                    self.stdout.write(self.style.SUCCESS(f'Processed {loaded} records...'))
+            flush()
+
+            # Whatever is left in `existing` is no longer in the CSV
+            self._invalidate_profiles(updated_ids + list(existing), batch_size)
+            deleted = self._delete(list(existing), batch_size)
+
+        return loaded, inserted, len(updated_ids), deleted
+
+    def handle(self, *args, **options):
+        file_path = options['file']
+        force = options['force']
+        if not os.path.isabs(file_path):
+            file_path = os.path.join(settings.BASE_DIR.parent, file_path)
+
+        if not os.path.exists(file_path):
+            self.stdout.write(self.style.ERROR(f'File not found at {file_path}'))
+            return
+
+        checksum = self._checksum(file_path)
+        if (
+            not force
+            and checksum == DatasetVersion.checksum_of(DatasetVersion.COMORBIDITIES)
+            and Comorbidity.objects.exists()
+        ):
+            self.stdout.write(self.style.WARNING('Comorbidities are up to date with the CSV. Skipping sync.'))
+            return
+
+        loader = options['loader']
+        if loader == 'auto':
+            loader = 'copy' if connection.vendor == 'postgresql' else 'orm'
+
+        self.stdout.write(self.style.NOTICE(f'Syncing comorbidities with the CSV ({loader} loader)...'))
+
+        started = time.perf_counter()
+        rows = self._read_rows(file_path)
+        if loader == 'copy':
+            loaded, inserted, updated, deleted = self._sync_with_copy(rows)
+        else:
+            loaded, inserted, updated, deleted = self._sync_with_orm(rows)
+        elapsed = time.perf_counter() - started
+
+        # Once per sync, for the search index (comorbidities.comorbidity_index)
+        DatasetVersion.bump(DatasetVersion.COMORBIDITIES, checksum=checksum)
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {loaded} rows in {elapsed:.2f}s ({loaded / elapsed if elapsed else 0:.0f} rows/s): '
+            f'{inserted} inserted, {updated} updated, {deleted} removed, '
+            f'{loaded - inserted - updated} unchanged.'
+        ))
         self.stdout.write(self.style.SUCCESS(f'Successfully populated {Comorbidity.objects.count()} comorbidities!'))
@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app_cicatrizando.image_jobs import claim_jobs, run_job
+
+
+def run_job_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # Pool threads would otherwise keep their own connections open
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Processes staged observation image uploads: fixes their orientation, re-encodes them, '
+        'renders their renditions and stores them (see app_cicatrizando/image_jobs.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.OBSERVATION_IMAGE_WORKER_THREADS,
+            help='Jobs processed in parallel (1 processes them in this thread)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when no job is due instead of polling for new ones',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds between polls while the queue is empty',
+        )
+
+    def _run_batches(self, run, batch_size, options):
+        while True:
+            jobs = claim_jobs(batch_size)
+            if not jobs:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            started = time.perf_counter()
+            stored = sum(run(jobs))
+            self.stdout.write(
+                f'{stored}/{len(jobs)} images stored in {time.perf_counter() - started:.2f}s'
+            )
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        self.stdout.write(self.style.NOTICE(f'Processing observation images with {threads} threads'))
+
+        if threads == 1:
+            self._run_batches(lambda jobs: map(run_job, jobs), 1, options)
+            return
+
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='observation-images') as pool:
+            self._run_batches(lambda jobs: pool.map(run_job_in_thread, jobs), threads, options)
@@ -1,6 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from .text import normalize_search_text
 
 django_user = get_user_model()
 
@@ -89,10 +95,96 @@ class WoundEdgeStatus(models.TextChoices):
     DEFINED_ROLLED = 'Bem definidas, não aderidas à base, enrolada, espessada', 'Bem definidas, não aderidas à base, enrolada, espessada'
     DEFINED_FIBROTIC = 'Bem definidas, fibróticas, com crostas e/ou hiperqueratose.', 'Bem definidas, fibróticas, com crostas e/ou hiperqueratose.'
 
+class ImageStatus(models.TextChoices):
+    NONE = 'none', 'Sem imagem'
+    PENDING = 'pending', 'Processando'
+    READY = 'ready', 'Pronta'
+    FAILED = 'failed', 'Falhou'
+
 class Comorbidity(models.Model):
     name = models.CharField(max_length=255)
     concept_id = models.CharField(max_length=255, primary_key=True)
     code = models.CharField(max_length=50, blank=True, null=True)
+    # Derived columns, kept in sync by save() and load_comorbidities:
+    # "macro" diseases have a code without a dot (e.g. 5A11, not 5A11.0) and
+    # are the only ones the search offers, as with the original
+    # `code__isnull=False` / `exclude(code__contains='.')` filter, so rows
+    # without a code are never offered; the normalized columns hold the
+    # lower-cased, unaccented name and code the search matches against
+    is_macro = models.BooleanField(default=False, editable=False)
+    name_normalized = models.CharField(max_length=255, default="", editable=False)
+    code_normalized = models.CharField(max_length=50, default="", editable=False)
+
+    DERIVED_FIELDS = {"is_macro", "name_normalized", "code_normalized"}
+
+    class Meta:
+        indexes = [
+            # Trigram indexes serve the substring filters of the search
+            # (requires pg_trgm, see comorbidities.create_trigram_extension)
+            GinIndex(
+                OpClass("name_normalized", name="gin_trgm_ops"),
+                condition=models.Q(is_macro=True),
+                name="comorbidity_name_trgm",
+            ),
+            GinIndex(
+                OpClass("code_normalized", name="gin_trgm_ops"),
+                condition=models.Q(is_macro=True),
+                name="comorbidity_code_trgm",
+            ),
+        ]
+
+    @staticmethod
+    def is_macro_code(code):
+        return code is not None and "." not in code
+
+    @classmethod
+    def derived_values(cls, code, name):
+        """(is_macro, name_normalized, code_normalized) for a code and name."""
+        return cls.is_macro_code(code), normalize_search_text(name), normalize_search_text(code)
+
+    def set_derived_fields(self):
+        self.is_macro, self.name_normalized, self.code_normalized = self.derived_values(self.code, self.name)
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"name", "code"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, *self.DERIVED_FIELDS}
+        super().save(*args, **kwargs)
+
+class DatasetVersion(models.Model):
+    """
+    Version stamp of a reference dataset loaded into the database, bumped once
+    by its loader after each sync (and by anything else that writes the
+    dataset). Per-process caches built from the dataset compare stamps to
+    know when to rebuild, and loaders compare the checksum of their source
+    file to skip unchanged reloads.
+    """
+    COMORBIDITIES = "comorbidities"
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=1)
+    # Checksum of the source file the table was last synced from; cleared by
+    # a bump() without one, since the table may no longer match that file
+    checksum = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def bump(cls, name, checksum=""):
+        updated = cls.objects.filter(name=name).update(
+            version=F("version") + 1, checksum=checksum, updated_at=timezone.now(),
+        )
+        if not updated:
+            cls.objects.get_or_create(name=name, defaults={"checksum": checksum})
+
+    @classmethod
+    def stamp(cls, name):
+        """(version, updated_at) of the dataset, or None if it was never written."""
+        return cls.objects.filter(name=name).values_list("version", "updated_at").first()
+
+    @classmethod
+    def checksum_of(cls, name):
+        return cls.objects.filter(name=name).values_list("checksum", flat=True).first() or ""
 
 class WoundsUser(models.Model):
     user = models.OneToOneField(django_user, on_delete=models.CASCADE, related_name="wounds_user")
@@ -111,6 +203,42 @@ class WoundsUser(models.Model):
         (Provider, "Especialista"),
     ]
     role = models.CharField(choices=roles, max_length=2, blank=True)
+
+    # Denormalized result of compute_registration_complete(), kept current by
+    # sync_registration_complete() and backfilled by backfill_registration_complete
+    registration_complete = models.BooleanField(default=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "city"]),
+            # The roster's city filter, which may come without a state
+            models.Index(fields=["city"]),
+        ]
+
+    def compute_registration_complete(self):
+        """
+        Check if user has completed registration.
+        Registration is complete when:
+        - WoundsUser has a role set and all information
+        - If role is Provider, Provider record exists with professional_id
+        - If role is Patient, Patient record exists, with at least one Provider
+        """
+        if self.birth_date is None or self.state == "" or self.city == "":
+            return False
+
+        if self.role == WoundsUser.Provider:
+            return Provider.objects.filter(wounds_user=self, professional_id__isnull=False).exists()
+        if self.role == WoundsUser.Patient:
+            return Patient.objects.filter(wounds_user=self, assigned_providers__isnull=False).exists()
+        return False
+
+    def sync_registration_complete(self):
+        """Recompute registration_complete and persist it if it changed."""
+        complete = self.compute_registration_complete()
+        if complete != self.registration_complete:
+            self.registration_complete = complete
+            self.save(update_fields=["registration_complete"])
+        return complete
     
 class Provider(models.Model):
     wounds_user = models.OneToOneField(WoundsUser, on_delete=models.CASCADE, related_name="provider")
@@ -134,6 +262,12 @@ class Patient(models.Model):
     assigned_providers = models.ManyToManyField(Provider)
     comorbidities = models.ManyToManyField(Comorbidity)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["gender"]),
+            models.Index(fields=["smoking_status"]),
+        ]
+
 class Wound(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="wounds")
     etiology = models.CharField(max_length=50, choices=WoundEtiology.choices)
@@ -149,7 +283,12 @@ class Observation(models.Model):
     wound = models.ForeignKey(Wound, on_delete=models.CASCADE, related_name="observations")
     author = models.ForeignKey(WoundsUser, on_delete=models.SET_NULL, null=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    # When the observation was recorded: the time of the request, or the
+    # device's time for observations synced after being recorded offline
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # UUID the device generated for an offline observation, so a repeated sync
+    # returns it instead of creating it again
+    client_id = models.UUIDField(blank=True, null=True, editable=False)
     
     # Clinical Metrics
     pain_level = models.IntegerField(validators=[MinValueValidator(0), MaxValueValidator(10)])
@@ -167,9 +306,115 @@ class Observation(models.Model):
     
     # Media
     image = models.ImageField(upload_to='observations/', blank=True, null=True)
+    # Downscaled renditions of `image`, generated by images.generate_renditions
+    image_thumbnail = models.ImageField(upload_to='observations/', blank=True, null=True, editable=False)
+    image_medium = models.ImageField(upload_to='observations/', blank=True, null=True, editable=False)
+    # Name of the image the renditions were generated from
+    image_renditions_source = models.CharField(max_length=255, blank=True, default='', editable=False)
+    # Uploads wait in an ObservationImageJob until the worker stores them
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.NONE, editable=False)
+    # Size of the upload and of the normalized image stored from it
+    image_original_bytes = models.PositiveBigIntegerField(blank=True, null=True, editable=False)
+    image_stored_bytes = models.PositiveBigIntegerField(blank=True, null=True, editable=False)
+    # Content-addressed files shared with the observations that uploaded the same image
+    image_source = models.ForeignKey(
+        "StoredImage", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="observations",
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pages of a wound's history (ObservationKeysetPagination)
+            models.Index(fields=["wound", "created_at", "id"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["author", "client_id"], name="unique_observation_client_id"),
+        ]
 
     def __str__(self):
         return f"Observation {self.created_at} for {self.wound}"
+
+
+class StoredImage(models.Model):
+    """
+    A normalized observation image and its renditions, stored under keys
+    derived from the SHA-256 of the uploaded bytes and shared by every
+    observation that uploaded the same bytes (see image_store). refcount
+    counts those observations; the files go with the last one.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    # Storage name of each rendition, by rendition ("thumbnail": ...)
+    renditions = models.JSONField(default=dict)
+    original_bytes = models.PositiveBigIntegerField()
+    stored_bytes = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
+class ObservationImageJob(models.Model):
+    """
+    An uploaded observation image waiting for the process_observation_images
+    worker to normalize it, render its renditions and push them to storage.
+    The upload is either staged on local disk (staged_path) or was put
+    directly into storage through a presigned URL (source_key). Finished jobs
+    are deleted; failed ones are kept with their error and upload for
+    inspection.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        PROCESSING = 'processing', 'Processing'
+        FAILED = 'failed', 'Failed'
+
+    observation = models.ForeignKey(Observation, on_delete=models.CASCADE, related_name="image_jobs")
+    staged_path = models.CharField(max_length=500, blank=True)
+    source_key = models.CharField(max_length=255, blank=True)
+    original_name = models.CharField(max_length=255)
+    # SHA-256 of the upload, when computed while staging it
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Earliest time a worker may (re)try the job
+    available_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+        ]
+
+    def __str__(self):
+        return f"Image job {self.pk} ({self.status}) for observation {self.observation_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The response to a POST sent with an Idempotency-Key header, replayed when
+    the same user retries it with the same key (see idempotency). Rows past
+    expires_at are ignored and deleted by purge_idempotency_keys.
+    """
+    user = models.ForeignKey(django_user, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    # SHA-256 of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key_per_user"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of user {self.user_id}"
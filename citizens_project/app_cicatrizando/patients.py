@@ -0,0 +1,73 @@
+"""
+Read model for patient profiles.
+
+Every endpoint that returns a patient (specialist list/retrieve/update/register,
+/auth/me and /patient/me) loads it through `patient_queryset` and renders it with
+`patient_payload`, so the response shape and the query cost live in one place:
+one query for the patient and its user, plus one prefetch query each for
+assigned specialists and comorbidities, regardless of how many there are.
+"""
+
+from django.db.models import Prefetch
+
+from .models import Patient, Provider
+from .serializers import ComorbiditySerializer
+
+
+def patient_queryset():
+    """Patients with every relation needed by `patient_payload` preloaded."""
+    return Patient.objects.select_related("wounds_user__user").prefetch_related(
+        Prefetch(
+            "assigned_providers",
+            queryset=Provider.objects.select_related("wounds_user__user").order_by("id"),
+        ),
+        "comorbidities",
+    )
+
+
+def load_patient(**filters):
+    """Fetch a single patient through `patient_queryset`. Raises Patient.DoesNotExist."""
+    return patient_queryset().get(**filters)
+
+
+def _specialist_summary(provider):
+    return {
+        "id": provider.id,
+        "name": provider.wounds_user.user.get_full_name(),
+        "professional_id": provider.professional_id,
+        "contact_phone": provider.contact_phone,
+        "contact_email": provider.contact_email,
+    }
+
+
+def patient_payload(patient, detailed_specialists=False):
+    """
+    Serialize a patient loaded through `patient_queryset` (see PatientDataSerializer).
+
+    Assigned specialists are rendered as a list of ids, or as summaries with
+    name and contact information when `detailed_specialists` is set.
+    """
+    wounds_user = patient.wounds_user
+    providers = patient.assigned_providers.all()
+
+    if detailed_specialists:
+        assigned_specialists = [_specialist_summary(p) for p in providers]
+    else:
+        assigned_specialists = [p.id for p in providers]
+
+    return {
+        "id": patient.id,
+        "name": wounds_user.user.get_full_name(),
+        "birth_date": wounds_user.birth_date,
+        "state": wounds_user.state,
+        "city": wounds_user.city,
+        "contact_phone": patient.contact_phone,
+        "contact_email": patient.contact_email,
+        "gender": patient.gender,
+        "height": patient.height,
+        "weight": patient.weight,
+        "smoking_status": patient.smoking_status,
+        "alcohol_consumption": patient.alcohol_consumption,
+        "assigned_specialists": assigned_specialists,
+        "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data,
+    }
@@ -0,0 +1,32 @@
+"""
+Per-user cache of the /auth/me profile document.
+
+Entries are written by MeView on a cache miss and removed by the signal
+handlers in `signals.py` whenever a model that feeds the profile changes.
+ME_PROFILE_CACHE_TIMEOUT bounds how long a missed invalidation can survive.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+ME_PROFILE_KEY = "me-profile:{user_id}"
+
+
+def me_profile_key(user_id):
+    return ME_PROFILE_KEY.format(user_id=user_id)
+
+
+def get_me_profile(user_id):
+    """Return the cached profile for `user_id`, or None on a miss."""
+    return cache.get(me_profile_key(user_id))
+
+
+def set_me_profile(user_id, profile):
+    cache.set(me_profile_key(user_id), profile, settings.ME_PROFILE_CACHE_TIMEOUT)
+
+
+def invalidate_me_profiles(user_ids):
+    """Drop the cached profiles of every user id in `user_ids`."""
+    keys = [me_profile_key(user_id) for user_id in user_ids if user_id is not None]
+    if keys:
+        cache.delete_many(keys)
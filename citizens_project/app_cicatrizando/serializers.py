@@ -1,6 +1,9 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
 from .models import Comorbidity, Observation, Wound
+from .uploads import CONTENT_TYPES
 
 
 # Valid Brazilian state codes
@@ -113,6 +116,26 @@ class RegisterPatientComorbiditySerializer(serializers.Serializer):
             raise serializers.ValidationError("Either patient_id or patient_email is required")
         return data
 
+class ObservationUploadSerializer(serializers.Serializer):
+    """Request for a presigned URL to upload an observation image directly to storage."""
+    content_type = serializers.ChoiceField(choices=CONTENT_TYPES)
+    filename = serializers.CharField(max_length=255, required=False, default="")
+    sha256 = serializers.RegexField(
+        r"^[0-9a-f]{64}$", required=False, default="", help_text="SHA-256 of the image, to skip uploading images already stored for the patient",
+    )
+
+class ObservationUploadFinalizeSerializer(serializers.Serializer):
+    upload_token = serializers.CharField()
+
+class ObservationSyncSerializer(serializers.Serializer):
+    """Observations recorded offline, each with the id of its `wound` and the ObservationSyncItemSerializer fields."""
+    observations = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_observations(self, value):
+        if len(value) > settings.OBSERVATION_SYNC_MAX_ITEMS:
+            raise serializers.ValidationError(f"At most {settings.OBSERVATION_SYNC_MAX_ITEMS} observations per request.")
+        return value
+
 
 # =============================================================================
 # Response Serializers
@@ -182,6 +205,17 @@ class MeResponseSerializer(serializers.Serializer):
     specialist = ProviderDataSerializer(allow_null=True)
     patient = PatientDataSerializer(allow_null=True)
 
+class ObservationUploadResponseSerializer(serializers.Serializer):
+    """Presigned PUT of an observation image; send upload_token to finalize-upload afterwards."""
+    upload_token = serializers.CharField()
+    # The image is already stored: finalize without uploading
+    exists = serializers.BooleanField()
+    key = serializers.CharField(allow_null=True)
+    url = serializers.URLField(allow_null=True)
+    method = serializers.CharField(allow_null=True)
+    headers = serializers.DictField(child=serializers.CharField())
+    expires_in = serializers.IntegerField(allow_null=True)
+
 class ComorbiditySerializer(serializers.ModelSerializer):
     class Meta:
         model = Comorbidity
@@ -204,16 +238,39 @@ class ObservationSerializer(serializers.ModelSerializer):
             'id', 'wound', 'author', 'author_name', 'author_role', 'created_at', 
             'pain_level', 'exudate_amount', 'exudate_type', 
             'tissue_type', 'dressing_changes', 'periwound_skin', 
-            'wound_edge', 'fever_24h', 'extra_notes', 'patient_guidelines', 'image'
+            'wound_edge', 'fever_24h', 'extra_notes', 'patient_guidelines', 'image',
+            'image_thumbnail', 'image_medium', 'image_status', 'client_id'
         ]
         read_only_fields = ['wound', 'author']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Projection of the observation history (`only` query parameter)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def _browser_url(self, url):
+        # If the URL is already absolute (S3), we just translate the internal
+        # docker host 'seaweedfs-s3' to 'localhost' for the browser
+        if url.startswith('http'):
+            return url.replace('seaweedfs-s3', 'localhost')
+
+        # Handle relative paths (fallback or FileSystemStorage)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        # Manual fallback
+        if url.startswith('//'):
+            return f"http:{url}"
+        return f"http://localhost:8000{url}"
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         request = self.context.get('request')
         
         # Privacy logic: If the viewer is a patient and the author is a specialist, hide extra_notes
-        if request and hasattr(request.user, 'wounds_user'):
+        if 'extra_notes' in representation and request and hasattr(request.user, 'wounds_user'):
             viewer_role = request.user.wounds_user.role
             author_role = instance.author.role if instance.author else None
             
@@ -221,26 +278,45 @@ class ObservationSerializer(serializers.ModelSerializer):
             if viewer_role == 'Pa' and author_role == 'Pr':
                 representation['extra_notes'] = None
         
-        # Fix image URL: ensure it's absolute and accessible by the browser.
-        # We replace the internal docker host 'seaweedfs-s3' with 'localhost'.
-        if instance.image:
-            url = instance.image.url
-            
-            # If the URL is already absolute (S3), we just translate the host for the browser
-            if url.startswith('http'):
-                if 'seaweedfs-s3' in url:
-                    url = url.replace('seaweedfs-s3', 'localhost')
-                representation['image'] = url
-            else:
-                # Handle relative paths (fallback or FileSystemStorage)
-                request = self.context.get('request')
-                if request is not None:
-                    representation['image'] = request.build_absolute_uri(url)
-                else:
-                    # Manual fallback
-                    if url.startswith('//'):
-                        representation['image'] = f"http:{url}"
-                    else:
-                        representation['image'] = f"http://localhost:8000{url}"
-                
+        # Fix image URLs: ensure they are absolute and accessible by the browser.
+        for field in ('image', 'image_thumbnail', 'image_medium'):
+            if field not in representation:
+                continue
+            image = getattr(instance, field)
+            if image:
+                representation[field] = self._browser_url(image.url)
+
         return representation
+
+
+class ObservationSyncItemSerializer(ObservationSerializer):
+    """One observation of a sync request, with the fields only an offline device sets."""
+    client_id = serializers.UUIDField(
+        required=False, help_text="UUID generated on the device; syncing it again returns the stored observation",
+    )
+    recorded_at = serializers.DateTimeField(
+        required=False, write_only=True, help_text="When the observation was recorded on the device (defaults to now)",
+    )
+
+    class Meta(ObservationSerializer.Meta):
+        fields = [*ObservationSerializer.Meta.fields, 'recorded_at']
+        # A client_id the author already synced is answered by sync_observations
+        validators = []
+
+    def validate_recorded_at(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("Cannot be in the future.")
+        return value
+
+
+class ObservationSyncResultSerializer(serializers.Serializer):
+    """Outcome of one observation of a sync request, at `index` in the request."""
+    index = serializers.IntegerField()
+    status = serializers.IntegerField(help_text="201 when created, 200 when its client_id was already synced, 400 when rejected")
+    observation = ObservationSerializer(required=False)
+    errors = serializers.DictField(required=False)
+
+class ObservationSyncResponseSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    results = ObservationSyncResultSerializer(many=True)
@@ -0,0 +1,133 @@
+"""
+Signal handlers that keep derived user state consistent.
+
+- Cached /auth/me profiles: a profile is built from the Django User, its
+  WoundsUser, and the Provider or Patient row (including the Patient M2M
+  tables), so a write to any of them drops the affected users' entries.
+- WoundsUser.registration_complete: views recompute it when they write profile
+  fields; the handlers here cover provider assignment and Provider/Patient
+  deletion, which can happen outside those views.
+- Observation image renditions: regenerated whenever an observation is saved
+  with an image other than the one they were rendered from. Staged uploads
+  are removed with their ObservationImageJob, and a deleted observation
+  releases its reference to a shared StoredImage.
+"""
+
+import os
+from contextlib import suppress
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .image_store import release
+from .images import generate_renditions
+from .models import Observation, ObservationImageJob, Patient, Provider, WoundsUser
+from .profile_cache import invalidate_me_profiles
+
+User = get_user_model()
+
+
+def _user_ids_for_wounds_users(wounds_user_ids):
+    return WoundsUser.objects.filter(pk__in=wounds_user_ids).values_list("user_id", flat=True)
+
+
+def _user_ids_for_patients(patient_ids):
+    return Patient.objects.filter(pk__in=patient_ids).values_list("wounds_user__user_id", flat=True)
+
+
+def _sync_registration_complete(wounds_users):
+    for wounds_user in wounds_users:
+        wounds_user.sync_registration_complete()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_profile(sender, instance, **kwargs):
+    invalidate_me_profiles([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=WoundsUser)
+def invalidate_wounds_user_profile(sender, instance, **kwargs):
+    invalidate_me_profiles([instance.user_id])
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Provider)
+def invalidate_role_profile(sender, instance, **kwargs):
+    invalidate_me_profiles(_user_ids_for_wounds_users([instance.wounds_user_id]))
+
+
+@receiver(pre_delete, sender=Patient)
+def invalidate_deleted_patient_profile(sender, instance, **kwargs):
+    invalidate_me_profiles(_user_ids_for_wounds_users([instance.wounds_user_id]))
+
+
+@receiver(pre_delete, sender=Provider)
+def invalidate_deleted_provider_profiles(sender, instance, **kwargs):
+    # Deleting a provider silently removes it from its patients' assigned_providers
+    instance._assigned_patient_ids = list(
+        Patient.objects.filter(assigned_providers=instance).values_list("pk", flat=True)
+    )
+    invalidate_me_profiles(_user_ids_for_patients(instance._assigned_patient_ids))
+    invalidate_me_profiles(_user_ids_for_wounds_users([instance.wounds_user_id]))
+
+
+@receiver(post_delete, sender=Provider)
+def sync_deleted_provider_registration(sender, instance, **kwargs):
+    patient_ids = getattr(instance, "_assigned_patient_ids", [])
+    _sync_registration_complete(WoundsUser.objects.filter(patient__pk__in=patient_ids))
+    _sync_registration_complete(WoundsUser.objects.filter(pk=instance.wounds_user_id))
+
+
+@receiver(post_delete, sender=Patient)
+def sync_deleted_patient_registration(sender, instance, **kwargs):
+    _sync_registration_complete(WoundsUser.objects.filter(pk=instance.wounds_user_id))
+
+
+@receiver(m2m_changed, sender=Patient.assigned_providers.through)
+def sync_assigned_patients_registration(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # instance is a Provider; remember its patients before they are unlinked
+        instance._cleared_patient_ids = list(instance.patient_set.values_list("pk", flat=True))
+    elif action not in ("post_add", "post_remove", "post_clear"):
+        return
+    elif not reverse:
+        _sync_registration_complete([instance.wounds_user])
+    else:
+        patient_ids = pk_set if action != "post_clear" else getattr(instance, "_cleared_patient_ids", [])
+        _sync_registration_complete(WoundsUser.objects.filter(patient__pk__in=patient_ids))
+
+
+@receiver(m2m_changed, sender=Patient.assigned_providers.through)
+@receiver(m2m_changed, sender=Patient.comorbidities.through)
+def invalidate_patient_relations_profile(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # instance is the Patient whose providers or comorbidities changed
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_me_profiles(_user_ids_for_patients([instance.pk]))
+    elif action in ("post_add", "post_remove"):
+        invalidate_me_profiles(_user_ids_for_patients(pk_set))
+    elif action == "pre_clear":
+        # instance is a Provider or Comorbidity; its patients are unknown after the clear
+        invalidate_me_profiles(_user_ids_for_patients(instance.patient_set.values_list("pk", flat=True)))
+
+
+@receiver(post_save, sender=Observation)
+def sync_observation_renditions(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if (instance.image.name or "") != instance.image_renditions_source:
+        generate_renditions(instance)
+
+
+@receiver(post_delete, sender=ObservationImageJob)
+def remove_staged_upload(sender, instance, **kwargs):
+    if instance.staged_path:
+        with suppress(FileNotFoundError):
+            os.remove(instance.staged_path)
+
+
+@receiver(post_delete, sender=Observation)
+def release_observation_image(sender, instance, **kwargs):
+    if instance.image_source_id:
+        release(instance.image_source_id)
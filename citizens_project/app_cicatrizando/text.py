@@ -0,0 +1,7 @@
+import unicodedata
+
+
+def normalize_search_text(text):
+    """Lower-case `text` and strip its accents ("Úlcera" -> "ulcera") for accent-insensitive search."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
@@ -0,0 +1,162 @@
+"""
+Direct-to-storage uploads of observation images.
+
+Instead of streaming the image through the API, a client:
+
+1. asks for a presigned S3 PUT URL (POST /wounds/<id>/observations/upload-url/),
+   scoped to a fresh observations/<uuid> key of the configured bucket;
+2. PUTs the image bytes to that URL;
+3. finalizes the upload for one of the wound's observations
+   (POST /wounds/<id>/observations/<observation_id>/finalize-upload/) with the
+   signed upload token it got with the URL.
+
+Finalizing checks the object with a HEAD request (it exists, is an accepted
+image type and is at most OBSERVATION_UPLOAD_MAX_BYTES) and hands it to the
+same processing as an upload through the API (see image_jobs).
+
+A client may send the SHA-256 of the image when asking for the URL: if those
+bytes are already stored for the same patient (see image_store), it gets no
+URL, skips the PUT and finalizes right away, linking the stored copy. The
+hash is the client's word, so it is only trusted for images already linked
+to an observation of that patient: it neither reveals nor hands out images
+of other patients.
+
+Only available when STORAGES["default"] is S3 (AWS_S3_ENDPOINT_URL set).
+"""
+
+import os
+import uuid
+from functools import lru_cache
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from storages.backends.s3 import S3Storage
+
+from .image_jobs import queue_stored_upload
+from .image_store import acquire, link
+from .models import ImageStatus, Observation, ObservationImageJob, StoredImage
+
+UPLOAD_TOKEN_SALT = "app_cicatrizando.observation-upload"
+CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+# Time left to finalize an upload once its URL expired
+FINALIZE_GRACE_SECONDS = 3600
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+def direct_uploads_enabled():
+    return isinstance(default_storage, S3Storage)
+
+
+@lru_cache(maxsize=4)
+def _presign_client(endpoint_url, access_key, secret_key, region_name):
+    # Signing is offline; the client only needs the endpoint the browser will call
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=region_name,
+        config=Config(signature_version=settings.AWS_S3_SIGNATURE_VERSION, s3={"addressing_style": settings.AWS_S3_ADDRESSING_STYLE}),
+    )
+
+
+def _patient_images(patient_id, sha256):
+    """StoredImages with `sha256` linked to an observation of the patient `patient_id`."""
+    return StoredImage.objects.filter(sha256=sha256, observations__wound__patient_id=patient_id)
+
+
+def create_upload(wound, content_type, filename="", sha256=""):
+    """
+    Presign a PUT of a new observations/<uuid> object for an image of `wound`.
+    When the image with the client-computed `sha256` is already stored for
+    the wound's patient, no URL is issued and the token links that copy.
+    """
+    if sha256 and _patient_images(wound.patient_id, sha256).exists():
+        token = signing.dumps({"sha256": sha256, "wound": wound.pk}, salt=UPLOAD_TOKEN_SALT)
+        return {"upload_token": token, "exists": True, "key": None, "url": None, "method": None, "headers": {}, "expires_in": None}
+
+    key = f"observations/{uuid.uuid4().hex}"
+    client = _presign_client(
+        settings.AWS_S3_PRESIGN_ENDPOINT_URL,
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        settings.AWS_S3_REGION_NAME,
+    )
+    url = client.generate_presigned_url(
+        "put_object",
+        Params={"Bucket": default_storage.bucket_name, "Key": key, "ContentType": content_type},
+        ExpiresIn=settings.OBSERVATION_UPLOAD_URL_EXPIRY,
+        HttpMethod="PUT",
+    )
+    token = signing.dumps(
+        {"key": key, "wound": wound.pk, "name": os.path.basename(filename)[:200]}, salt=UPLOAD_TOKEN_SALT,
+    )
+    return {
+        "upload_token": token,
+        "exists": False,
+        "key": key,
+        "url": url,
+        "method": "PUT",
+        "headers": {"Content-Type": content_type},
+        "expires_in": settings.OBSERVATION_UPLOAD_URL_EXPIRY,
+    }
+
+
+def _head(key):
+    try:
+        return default_storage.connection.meta.client.head_object(Bucket=default_storage.bucket_name, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            raise InvalidUpload("The image was not uploaded") from e
+        raise
+
+
+def finalize_upload(observation, upload_token):
+    """Attach the object uploaded with `upload_token` to `observation` as its image."""
+    try:
+        upload = signing.loads(
+            upload_token,
+            salt=UPLOAD_TOKEN_SALT,
+            max_age=settings.OBSERVATION_UPLOAD_URL_EXPIRY + FINALIZE_GRACE_SECONDS,
+        )
+    except signing.BadSignature as e:
+        raise InvalidUpload("Invalid or expired upload token") from e
+
+    if upload["wound"] != observation.wound_id:
+        raise InvalidUpload("The upload token was issued for another wound")
+    if observation.image or observation.image_status == ImageStatus.PENDING:
+        raise InvalidUpload("The observation already has an image")
+
+    if "sha256" in upload:
+        stored = None
+        if _patient_images(observation.wound.patient_id, upload["sha256"]).exists():
+            stored = acquire(upload["sha256"])
+        if stored is None:
+            raise InvalidUpload("The image is no longer stored, request a new upload URL")
+        link(observation, stored)
+        return observation
+
+    key = upload["key"]
+    if (
+        Observation.objects.filter(image=key).exists()
+        or ObservationImageJob.objects.filter(source_key=key).exists()
+    ):
+        raise InvalidUpload("The upload was already finalized")
+
+    head = _head(key)
+    if head.get("ContentType") not in CONTENT_TYPES:
+        default_storage.delete(key)
+        raise InvalidUpload(f"The uploaded object must be one of {', '.join(CONTENT_TYPES)}")
+    if head["ContentLength"] > settings.OBSERVATION_UPLOAD_MAX_BYTES:
+        default_storage.delete(key)
+        raise InvalidUpload(f"The image exceeds {settings.OBSERVATION_UPLOAD_MAX_BYTES} bytes")
+
+    queue_stored_upload(observation, key, upload["name"] or os.path.basename(key))
+    return observation
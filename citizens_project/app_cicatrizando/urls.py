@@ -16,6 +16,7 @@ from .views import (
     SpecialistRegistrationView,
     UpdateFieldsView,
     WoundViewSet,
+    google_login_async,
 )
 
 router = routers.DefaultRouter()
@@ -37,6 +38,7 @@ router.register(r'comorbidities/search', ComorbiditySearchView, basename='comorb
 router.register(r'wounds', WoundViewSet, basename='wounds')
 
 urlpatterns = [
+    path('auth/google/async/', google_login_async, name='google-login-async'),
     path('', include(router.urls)),
     path('Update/', UpdateFieldsView.as_view({'patch': 'patch'}), name="Update Information"),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
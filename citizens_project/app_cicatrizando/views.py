@@ -1,18 +1,36 @@
+import json
 import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, time
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import Q
-from drf_spectacular.utils import OpenApiResponse, extend_schema
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .google import google_get_user_data
-from .models import Comorbidity, Patient, Provider, Wound, WoundsUser
+from .comorbidities import comorbidity_index, search_comorbidities
+from .google import async_google_get_user_data, google_get_user_data
+from .idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from .image_jobs import stage_upload
+from .models import Comorbidity, GenderChoices, Observation, Patient, Provider, SmokingChoices, Wound, WoundsUser
+from .patients import load_patient, patient_payload, patient_queryset
+from .profile_cache import get_me_profile, set_me_profile
+from .uploads import InvalidUpload, create_upload, direct_uploads_enabled, finalize_upload
 from .serializers import (
     GoogleAuthSerializer,
     GoogleAuthResponseSerializer,
@@ -25,7 +43,13 @@ from .serializers import (
     MeResponseSerializer,
     ComorbiditySerializer,
     WoundSerializer,
-    ObservationSerializer
+    ObservationSerializer,
+    ObservationUploadSerializer,
+    ObservationUploadFinalizeSerializer,
+    ObservationUploadResponseSerializer,
+    ObservationSyncItemSerializer,
+    ObservationSyncSerializer,
+    ObservationSyncResponseSerializer
 )
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -44,38 +68,45 @@ def _user_display_name(user):
     full_name = user.get_full_name().strip()
     return full_name or None
 
-def _is_registration_complete(user):
-    """
-    Check if user has completed registration.
-    Registration is complete when:
-    - WoundsUser exists, with a role set and all information
-    - If role is Provider, Provider record exists with professional_id
-    - If role is Patient, Patient record exists, with at least one Provider
-    """
-
-    try:
-        wounds_user = user.wounds_user
-    except WoundsUser.DoesNotExist:
-        return False
-
-    if wounds_user.birth_date is None or wounds_user.state == "" or wounds_user.city == "":
-        return False
-
-    if wounds_user.role == WoundsUser.Provider:
-        result = Provider.objects.filter(wounds_user=wounds_user, professional_id__isnull=False).exists()
-    elif wounds_user.role == WoundsUser.Patient:
-        result = Patient.objects.filter(wounds_user=wounds_user, assigned_providers__isnull=False).exists()
-    else:
-        result = False
-
-    return result
-
 def _get_user_role_display(wounds_user:  WoundsUser) -> str: 
     """Convert role code to display string."""
     if not wounds_user or not wounds_user.role:
         return None
     return "specialist" if wounds_user.role == WoundsUser.Provider else "patient"
 
+def _google_user_fields(google_user_data):
+    """Return (email, full name, User defaults) for a Google login."""
+    user_given_email = google_user_data.get("email")
+    full_name = (
+        google_user_data.get("name") or
+        f"{google_user_data.get('given_name', '')} {google_user_data.get('family_name', '')}".strip() or
+        user_given_email.split('@')[0]
+    )
+
+    first_name, last_name = _split_full_name(full_name)
+    defaults = {
+        "first_name": first_name,
+        "last_name" : last_name,
+        "email": user_given_email
+    }
+    return user_given_email, full_name, defaults
+
+def _google_login_response(user, wounds_user, full_name, is_new):
+    """Build the GoogleAuthResponseSerializer payload and status code. Runs no queries."""
+    token = RefreshToken.for_user(user)
+
+    response_data = {
+        "access": str(token.access_token),             
+        "refresh": str(token),
+        "email": user.email,
+        "full_name": full_name,
+        "registration_complete": wounds_user.registration_complete,
+        "role": _get_user_role_display(wounds_user),
+    }
+
+    status_code = status.HTTP_201_CREATED if is_new else status.HTTP_200_OK
+    return response_data, status_code
+
 # Registration views
 class GoogleLoginView(viewsets.ViewSet):
     """
@@ -103,45 +134,55 @@ class GoogleLoginView(viewsets.ViewSet):
         google_user_data = google_get_user_data(data["auth_code"], data.get("redirect_uri", "postmessage"))
         logger.debug(f"User data from Google: {google_user_data}")
 
-        user_given_email = google_user_data.get("email")
-        full_name = (
-            google_user_data.get("name") or
-            f"{google_user_data.get('given_name', '')} {google_user_data.get('family_name', '')}".strip() or
-            user_given_email.split('@')[0]
-        )
-
-        first_name, last_name = _split_full_name(full_name)
+        user_given_email, full_name, user_defaults = _google_user_fields(google_user_data)
         
         user, new = User.objects.get_or_create(
             username=user_given_email,
-        
-            defaults={
-                "first_name": first_name,
-                "last_name" : last_name,
-                "email": user_given_email
-            }
+            defaults=user_defaults,
         )
     
         wounds_user, wounds_user_created = WoundsUser.objects.get_or_create(
             user=user
         )
 
-        is_new = new or wounds_user_created
-        registration_complete = _is_registration_complete(user)
+        response_data, status_code = _google_login_response(user, wounds_user, full_name, new or wounds_user_created)
+        return Response(response_data, status=status_code)
+
+@csrf_exempt
+@require_POST
+async def google_login_async(request):
+    """
+    Async twin of GoogleLoginView.create for ASGI deployments.
 
-        token = RefreshToken.for_user(user)
+    Google calls go through the httpx client in google.py and the user lookups
+    through the async ORM, so a worker is not blocked while Google responds.
+    Accepts and returns the same JSON as POST /auth/google/.
+    """
+    try:
+        body = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"detail": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
 
-        response_data = {
-            "access": str(token.access_token),             
-            "refresh": str(token),
-            "email": user.email,
-            "full_name": full_name,
-            "registration_complete": registration_complete,
-            "role": _get_user_role_display(wounds_user),
-        }
+    serializer = GoogleAuthSerializer(data=body)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
 
-        status_code = status.HTTP_201_CREATED if is_new else status.HTTP_200_OK
-        return Response(response_data, status=status_code)
+    try:
+        google_user_data = await async_google_get_user_data(data["auth_code"], data.get("redirect_uri", "postmessage"))
+    except APIException as e:
+        return JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+
+    user_given_email, full_name, user_defaults = _google_user_fields(google_user_data)
+
+    user, new = await User.objects.aget_or_create(
+        username=user_given_email,
+        defaults=user_defaults,
+    )
+    wounds_user, wounds_user_created = await WoundsUser.objects.aget_or_create(user=user)
+
+    response_data, status_code = _google_login_response(user, wounds_user, full_name, new or wounds_user_created)
+    return JsonResponse(response_data, status=status_code)
 
 class SpecialistRegistrationView(viewsets.ViewSet):
     """
@@ -180,7 +221,6 @@ class SpecialistRegistrationView(viewsets.ViewSet):
         wounds_user.state = data["state"]
         wounds_user.city = data["city"]
         wounds_user.role = WoundsUser.Provider
-        wounds_user.save()
 
         provider, _ = Provider.objects.update_or_create(
             wounds_user=wounds_user,
@@ -191,6 +231,9 @@ class SpecialistRegistrationView(viewsets.ViewSet):
             }
         )
 
+        wounds_user.registration_complete = wounds_user.compute_registration_complete()
+        wounds_user.save()
+
         response_data = {
             "message": "Specialist registered successfully",
             "user": {
@@ -213,14 +256,167 @@ class SpecialistRegistrationView(viewsets.ViewSet):
 
 # Functionality views
 
+class KeysetPagination(BasePagination):
+    """Page size and cursor parameters shared by the keyset paginations below."""
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+class PatientCursorPagination(KeysetPagination):
+    """
+    Keyset pagination for a specialist's patient roster.
+
+    Ordering is chosen with the `ordering` query parameter among the keys of
+    `ordering_fields`, and `id` always breaks ties. The cursor holds the value
+    of every ordering field of the patient a page ends (or, for `previous`,
+    starts) at, so each page is a range scan however many patients share a
+    name or city.
+    """
+    ordering_fields = {
+        "id": ("id",),
+        "name": ("wounds_user__user__first_name", "wounds_user__user__last_name"),
+        "city": ("wounds_user__city",),
+        "state": ("wounds_user__state",),
+    }
+
+    def get_ordering(self, request):
+        """The ordering fields, ending with id, and whether they are descending."""
+        requested = request.query_params.get("ordering", "")
+        fields = self.ordering_fields.get(requested.lstrip("-"))
+        if not fields:
+            return ("id",), False
+        if fields[-1] != "id":
+            fields = (*fields, "id")
+        return fields, requested.startswith("-")
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor["position"], cursor["reverse"]
+        except (ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor of another ordering
+        if not isinstance(position, list) or len(position) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+    def encode_cursor(self, patient, reverse):
+        position = []
+        for field in self.fields:
+            # Ordering fields may span relations (e.g. wounds_user__city)
+            value = patient
+            for attr in field.split("__"):
+                value = getattr(value, attr)
+            position.append(value)
+        cursor = json.dumps({"position": position, "reverse": reverse})
+        return replace_query_param(self.base_url, self.cursor_query_param, urlsafe_b64encode(cursor.encode()).decode())
+
+    def _beyond(self, position, descending):
+        # Rows strictly after `position` in the (descending) lexicographic order
+        lookup = "lt" if descending else "gt"
+        beyond = Q()
+        for i, field in enumerate(self.fields):
+            beyond |= Q(**dict(zip(self.fields[:i], position[:i])), **{f"{field}__{lookup}": position[i]})
+        return beyond
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        self.fields, descending = self.get_ordering(request)
+        position, reverse = self.decode_cursor(request, self.fields)
+
+        # A previous page is read backwards from its cursor, then flipped
+        backwards = descending != reverse
+        queryset = queryset.order_by(*(f"-{field}" if backwards else field for field in self.fields))
+        if position is not None:
+            queryset = queryset.filter(self._beyond(position, backwards))
+
+        patients = list(queryset[:page_size + 1])
+        has_more = len(patients) > page_size
+        page = patients[:page_size]
+        if reverse:
+            page.reverse()
+
+        if reverse:
+            more_before, more_after = has_more, position is not None
+        else:
+            more_before, more_after = position is not None, has_more
+        self.next_link = self.encode_cursor(page[-1], reverse=False) if page and more_after else None
+        self.previous_link = self.encode_cursor(page[0], reverse=True) if page and more_before else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.next_link, "previous": self.previous_link, "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
 class SpecialistPatientListView(viewsets.ViewSet):
     """
         GET all patients related to a specific Provider/specialist
+
+        Results are cursor paginated and can be filtered with the `name`, `city`,
+        `state`, `gender`, `smoking_status` and `comorbidity` (concept_id) query
+        parameters, and sorted with `ordering` (see PatientCursorPagination).
     """
 
     permission_classes = [IsAuthenticated]
+    pagination_class = PatientCursorPagination
+
+    def _filter_patients(self, queryset, params):
+        name = params.get("name")
+        if name:
+            for part in name.split():
+                queryset = queryset.filter(
+                    Q(wounds_user__user__first_name__icontains=part) |
+                    Q(wounds_user__user__last_name__icontains=part)
+                )
+        if params.get("city"):
+            queryset = queryset.filter(wounds_user__city=params["city"])
+        if params.get("state"):
+            queryset = queryset.filter(wounds_user__state=params["state"].upper())
+        if params.get("gender"):
+            queryset = queryset.filter(gender=params["gender"].upper())
+        if params.get("smoking_status"):
+            queryset = queryset.filter(smoking_status=params["smoking_status"].upper())
+        if params.get("comorbidity"):
+            queryset = queryset.filter(comorbidities__concept_id=params["comorbidity"])
+        return queryset
 
     @extend_schema(
+        parameters=[
+            OpenApiParameter("name", str, description="Matches every word against the patient's first or last name"),
+            OpenApiParameter("city", str),
+            OpenApiParameter("state", str, description="Two-letter Brazilian state code"),
+            OpenApiParameter("gender", str, enum=GenderChoices.values),
+            OpenApiParameter("smoking_status", str, enum=SmokingChoices.values),
+            OpenApiParameter("comorbidity", str, description="Comorbidity concept_id"),
+            OpenApiParameter("ordering", str, enum=[
+                prefix + key for key in PatientCursorPagination.ordering_fields for prefix in ("", "-")
+            ]),
+        ],
         responses={
             200: OpenApiResponse(response=PatientDataSerializer(many=True)),
             404: OpenApiResponse(description="Specialist does not exist")
@@ -233,30 +429,14 @@ class SpecialistPatientListView(viewsets.ViewSet):
         except (WoundsUser.DoesNotExist, Provider.DoesNotExist, AttributeError):
             return Response("Specialist does not exist", status=status.HTTP_404_NOT_FOUND)
 
-        patients = Patient.objects.filter(assigned_providers=provider)
+        patients = patient_queryset().filter(assigned_providers=provider)
+        patients = self._filter_patients(patients, request.query_params)
 
-        response_data = []
-        for patient in patients:
-            user_obj = patient.wounds_user.user
-            name = user_obj.get_full_name()
-            
-            response_data.append({
-                "id": patient.id,
-                "name": name,
-                "birth_date": patient.wounds_user.birth_date,
-                "state": patient.wounds_user.state,
-                "city": patient.wounds_user.city,
-                "contact_phone": patient.contact_phone,
-                "contact_email": patient.contact_email,
-                "gender": patient.gender,
-                "height": patient.height,
-                "weight": patient.weight,
-                "smoking_status": patient.smoking_status,
-                "alcohol_consumption": patient.alcohol_consumption,
-                "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data
-            })
-        
-        return Response(response_data)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(patients, request, view=self)
+
+        response_data = [patient_payload(patient) for patient in page]
+        return paginator.get_paginated_response(response_data)
 
 class SpecialistPatientUpdateView(viewsets.ViewSet):
     serializer = PatientRegisterSerializer
@@ -272,30 +452,13 @@ class SpecialistPatientUpdateView(viewsets.ViewSet):
         user = request.user
         try:
             provider = user.wounds_user.provider
-            patient = Patient.objects.get(pk=pk, assigned_providers=provider)
+            patient = load_patient(pk=pk, assigned_providers=provider)
         except (WoundsUser.DoesNotExist, Provider.DoesNotExist):
             return Response("Specialist does not exist", status=status.HTTP_404_NOT_FOUND)
         except Patient.DoesNotExist:
             return Response("Patient not found or not assigned to this specialist", status=status.HTTP_404_NOT_FOUND)
 
-        wounds_user = patient.wounds_user
-        response = {
-            "id": patient.id,
-            "name": wounds_user.user.get_full_name(),
-            "birth_date": wounds_user.birth_date,
-            "state": wounds_user.state,
-            "city": wounds_user.city,
-            "contact_phone": patient.contact_phone,
-            "contact_email": patient.contact_email,
-            "gender": patient.gender,
-            "height": patient.height,
-            "weight": patient.weight,
-            "smoking_status": patient.smoking_status,
-            "alcohol_consumption": patient.alcohol_consumption,
-            "assigned_specialists": [p.id for p in patient.assigned_providers.all()],
-            "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data
-        }
-        return Response(response, status=status.HTTP_200_OK)
+        return Response(patient_payload(patient), status=status.HTTP_200_OK)
 
     @extend_schema(
         responses={
@@ -307,7 +470,7 @@ class SpecialistPatientUpdateView(viewsets.ViewSet):
         user = request.user
         try:
             provider = user.wounds_user.provider
-            patient = Patient.objects.get(pk=pk, assigned_providers=provider)
+            patient = Patient.objects.select_related("wounds_user__user").get(pk=pk, assigned_providers=provider)
         except (WoundsUser.DoesNotExist, Provider.DoesNotExist):
             return Response("Specialist does not exist", status=status.HTTP_404_NOT_FOUND)
         except Patient.DoesNotExist:
@@ -342,6 +505,7 @@ class SpecialistPatientUpdateView(viewsets.ViewSet):
             wounds_user.state = data["state"]
         if "city" in data:
             wounds_user.city = data["city"]
+        wounds_user.registration_complete = wounds_user.compute_registration_complete()
         wounds_user.save()
 
         # Update User fields (name)
@@ -357,23 +521,7 @@ class SpecialistPatientUpdateView(viewsets.ViewSet):
             comorbidities = Comorbidity.objects.filter(concept_id__in=data["comorbidities"])
             patient.comorbidities.set(comorbidities)
 
-        response = {
-            "id": patient.id,
-            "name": wounds_user.user.get_full_name() or data.get("name", ""),
-            "birth_date": wounds_user.birth_date,
-            "state": wounds_user.state,
-            "city": wounds_user.city,
-            "contact_phone": patient.contact_phone,
-            "contact_email": patient.contact_email,
-            "gender": patient.gender,
-            "height": patient.height,
-            "weight": patient.weight,
-            "smoking_status": patient.smoking_status,
-            "alcohol_consumption": patient.alcohol_consumption,
-            "assigned_specialists": [p.id for p in patient.assigned_providers.all()],
-            "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data
-        }
-        return Response(response, status=status.HTTP_200_OK)
+        return Response(patient_payload(load_patient(pk=patient.pk)), status=status.HTTP_200_OK)
 
     def partial_update(self, request, pk=None):
         return self.update(request, pk)
@@ -429,25 +577,10 @@ class SpecialistPatientRegisterView(viewsets.ViewSet):
             if "birth_date" in data: patient_wounds_user_object.birth_date = data["birth_date"]
             if "state" in data: patient_wounds_user_object.state = data["state"]
             if "city" in data: patient_wounds_user_object.city = data["city"]
+            patient_wounds_user_object.registration_complete = patient_wounds_user_object.compute_registration_complete()
             patient_wounds_user_object.save()
 
-            response = {
-                "id": patient.id,
-                "name": data.get("name"),
-                "birth_date": patient_wounds_user_object.birth_date,
-                "state": patient_wounds_user_object.state,
-                "city": patient_wounds_user_object.city,
-                "contact_phone": patient.contact_phone,
-                "contact_email": patient.contact_email,
-                "gender": patient.gender,
-                "height": patient.height,
-                "weight": patient.weight,
-                "smoking_status": patient.smoking_status,
-                "alcohol_consumption": patient.alcohol_consumption,
-                "assigned_specialists": [p.id for p in patient.assigned_providers.all()],
-                "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data
-            }
-            return Response(response, status=status.HTTP_200_OK)
+            return Response(patient_payload(load_patient(pk=patient.pk)), status=status.HTTP_200_OK)
 
 
         patient_wounds_user = WoundsUser.objects.create(
@@ -477,24 +610,7 @@ class SpecialistPatientRegisterView(viewsets.ViewSet):
             comorbidities = Comorbidity.objects.filter(concept_id__in=data["comorbidities"])
             patient.comorbidities.set(comorbidities)
 
-        response = {
-          
-            "id": patient.id,
-            "name": data.get("name"),
-            "birth_date": patient_wounds_user.birth_date,
-            "state": patient_wounds_user.state,
-            "city": patient_wounds_user.city,
-            "contact_phone": patient.contact_phone,
-            "contact_email": patient.contact_email,
-            "gender": patient.gender,
-            "height": patient.height,
-            "weight": patient.weight,
-            "smoking_status": patient.smoking_status,
-            "alcohol_consumption": patient.alcohol_consumption,
-            "assigned_specialists": [p.id for p in patient.assigned_providers.all()],
-            "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data
-        }
-        return Response(response, status=status.HTTP_201_CREATED)
+        return Response(patient_payload(load_patient(pk=patient.pk)), status=status.HTTP_201_CREATED)
 
 class RegisterPatientComorbidityView(viewsets.ViewSet):
     serializer = RegisterPatientComorbiditySerializer
@@ -587,6 +703,7 @@ class UpdateFieldsView(viewsets.ViewSet):
         if data.get("birth_date"):
             wounds_user.birth_date = data["birth_date"]
 
+        wounds_user.registration_complete = wounds_user.compute_registration_complete()
         wounds_user.save()
 
         if wounds_user.role == WoundsUser.Provider:
@@ -654,17 +771,15 @@ class MeView(viewsets.ViewSet):
     
     Returns user data including role-specific information.
     Requires JWT authentication.
+
+    The profile is served from a per-user cache (see profile_cache.py) and the
+    token is checked without loading the user, so a warm request costs no
+    database queries.
     """
+    authentication_classes = [JWTStatelessUserAuthentication]
     permission_classes = [IsAuthenticated]
 
-    @extend_schema(
-        responses={
-            200: OpenApiResponse(response=MeResponseSerializer)
-        }
-    )
-    def list(self, request):
-        user = request.user
-        
+    def _build_profile(self, user):
         wounds_user = user.wounds_user
 
         response = {
@@ -675,7 +790,7 @@ class MeView(viewsets.ViewSet):
             "state": wounds_user.state or None,
             "city": wounds_user.city or None,
             "role": _get_user_role_display(wounds_user),
-            "registration_complete": _is_registration_complete(user),
+            "registration_complete": wounds_user.registration_complete,
         }
         
         if wounds_user.role == WoundsUser.Provider:
@@ -689,26 +804,29 @@ class MeView(viewsets.ViewSet):
             }
 
         elif wounds_user.role == WoundsUser.Patient:
-            patient = wounds_user.patient
+            response["patient"] = patient_payload(load_patient(wounds_user=wounds_user))
 
-            response["patient"] = {
-                "id": patient.id,
-                "name": user.get_full_name(),
-                "birth_date": wounds_user.birth_date,
-                "state": wounds_user.state,
-                "city": wounds_user.city,
-                "contact_phone": patient.contact_phone,
-                "contact_email": patient.contact_email,
-                "gender": patient.gender,
-                "height": patient.height,
-                "weight": patient.weight,
-                "smoking_status": patient.smoking_status,
-                "alcohol_consumption": patient.alcohol_consumption,
-                "assigned_specialists": [p.id for p in patient.assigned_providers.all()],
-                "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data
-            }
+        return response
 
-        return Response(response)
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(response=MeResponseSerializer)
+        }
+    )
+    def list(self, request):
+        user_id = request.user.id
+        
+        profile = get_me_profile(user_id)
+        if profile is None:
+            try:
+                user = User.objects.select_related("wounds_user").get(pk=user_id, is_active=True)
+            except User.DoesNotExist:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+
+            profile = self._build_profile(user)
+            set_me_profile(user_id, profile)
+
+        return Response(profile)
 
 class PatientMeView(viewsets.ViewSet):
     """
@@ -724,40 +842,14 @@ class PatientMeView(viewsets.ViewSet):
     def list(self, request):
         user = request.user
         try:
-            wounds_user = user.wounds_user
-            patient = wounds_user.patient
-        except (WoundsUser.DoesNotExist, Patient.DoesNotExist):
+            patient = load_patient(wounds_user__user=user)
+        except Patient.DoesNotExist:
             return Response("Patient profile not found", status=status.HTTP_404_NOT_FOUND)
 
-        if wounds_user.role != WoundsUser.Patient:
+        if patient.wounds_user.role != WoundsUser.Patient:
             return Response("Access denied: Not a patient", status=status.HTTP_403_FORBIDDEN)
 
-        response_data = {
-            "id": patient.id,
-            "name": user.get_full_name(),
-            "birth_date": wounds_user.birth_date,
-            "state": wounds_user.state,
-            "city": wounds_user.city,
-            "contact_phone": patient.contact_phone,
-            "contact_email": patient.contact_email,
-            "gender": patient.gender,
-            "height": patient.height,
-            "weight": patient.weight,
-            "smoking_status": patient.smoking_status,
-            "alcohol_consumption": patient.alcohol_consumption,
-            "assigned_specialists": [
-                {
-                    "id": p.id,
-                    "name": p.wounds_user.user.get_full_name(),
-                    "professional_id": p.professional_id,
-                    "contact_phone": p.contact_phone,
-                    "contact_email": p.contact_email
-                } for p in patient.assigned_providers.all()
-            ],
-            "comorbidities": ComorbiditySerializer(patient.comorbidities.all(), many=True).data
-        }
-        
-        return Response(response_data)
+        return Response(patient_payload(patient, detailed_specialists=True))
 
 class ComorbidityPagination(LimitOffsetPagination):
     default_limit = 20
@@ -770,14 +862,126 @@ class ComorbiditySearchView(viewsets.ReadOnlyModelViewSet):
     pagination_class = ComorbidityPagination
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        # Filter for "macro" diseases only: must have a code, and code must not contain a dot '.'
-        queryset = queryset.filter(code__isnull=False).exclude(code__contains='.')
-        
+        # "Macro" diseases only (code without a dot), ranked by similarity to the search
         search_query = self.request.query_params.get('search', None)
-        if search_query:
-            queryset = queryset.filter(Q(name__icontains=search_query) | Q(code__icontains=search_query))
-        return queryset
+        return search_comorbidities(search_query)
+
+    def list(self, request, *args, **kwargs):
+        if not settings.COMORBIDITY_SEARCH_IN_MEMORY:
+            return super().list(request, *args, **kwargs)
+
+        results = comorbidity_index.search(request.query_params.get('search', None))
+        page = self.paginate_queryset(results)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+class ObservationKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination of a wound's observation history, newest first.
+
+    The cursor is the (created_at, id) of the last observation of a page, so
+    every page is a range scan of the (wound, created_at, id) index however
+    far the client scrolled, and observations added meanwhile do not shift
+    the pages. Only forward (`next`) links are given.
+
+    Clients opt in by sending `page_size` or `cursor`; other requests get the
+    whole history as a plain list, as before pagination existed.
+    """
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = urlsafe_b64decode(encoded.encode()).decode().rsplit("|", 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, observation):
+        position = f"{observation.created_at.isoformat()}|{observation.pk}"
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, urlsafe_b64encode(position.encode()).decode()
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not {self.page_size_query_param, self.cursor_query_param} & set(request.query_params):
+            return None
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by("-created_at", "-id")
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            # (created_at, id) < cursor, with created_at <= cursor as the index bound
+            queryset = queryset.filter(
+                Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+            )
+
+        observations = list(queryset[:page_size + 1])
+        page = observations[:page_size]
+        self.next_link = self.encode_cursor(page[-1]) if len(observations) > page_size else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.next_link, "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+def _parse_timestamp(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        timestamp = parse_datetime(value)
+        if timestamp is None and parse_date(value) is not None:
+            timestamp = datetime.combine(parse_date(value), time.min)
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise ValueError(f"{name} must be an ISO 8601 date or datetime.")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+def _observation_history(wound, params):
+    """
+    The observations of `wound` within the `since`/`until` window and the
+    serializer fields to return (`only`), loading just the columns they need.
+    """
+    fields = ObservationSerializer.Meta.fields
+    if params.get('only'):
+        requested = [field.strip() for field in params['only'].split(',') if field.strip()]
+        unknown = sorted(set(requested) - set(fields))
+        if unknown:
+            raise ValueError(f"Unknown fields in only: {', '.join(unknown)}. Valid fields: {', '.join(fields)}.")
+        # The id is always returned
+        fields = ['id', *(field for field in requested if field != 'id')]
+
+    columns = {field.name for field in Observation._meta.concrete_fields}
+    # Authors are joined in the same query, for author_name/author_role and
+    # for hiding the specialists' extra_notes from patients
+    observations = wound.observations.select_related('author__user').only(
+        'id', 'created_at', 'author', 'author__role', 'author__user__first_name', 'author__user__last_name',
+        *(field for field in fields if field in columns),
+    )
+
+    since = _parse_timestamp(params, 'since')
+    until = _parse_timestamp(params, 'until')
+    if since:
+        observations = observations.filter(created_at__gte=since)
+    if until:
+        observations = observations.filter(created_at__lt=until)
+    return observations, fields
 
 class WoundViewSet(viewsets.ModelViewSet):
     """
@@ -788,41 +992,212 @@ class WoundViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        queryset = Wound.objects.all()
-        user = self.request.user
+        # patient_name reads the patient's user of every wound
+        queryset = Wound.objects.select_related('patient__wounds_user__user')
         
         # Filter by patient_id if provided
         patient_id = self.request.query_params.get('patient_id')
         if patient_id:
             queryset = queryset.filter(patient_id=patient_id)
             
+        wounds_user = getattr(self.request.user, 'wounds_user', None)
         # Security: Patients only see their own wounds
-        if hasattr(user, 'wounds_user') and user.wounds_user.role == WoundsUser.Patient:
-            queryset = queryset.filter(patient__wounds_user=user.wounds_user)
+        if wounds_user is not None and wounds_user.role == WoundsUser.Patient:
+            queryset = queryset.filter(patient__wounds_user=wounds_user)
         # Security: Specialists only see wounds of their assigned patients
-        elif hasattr(user, 'wounds_user') and user.wounds_user.role == WoundsUser.Provider:
-            queryset = queryset.filter(patient__assigned_providers=user.wounds_user.provider)
+        elif wounds_user is not None and wounds_user.role == WoundsUser.Provider:
+            # EXISTS rather than joining assigned_providers, which repeats
+            # wounds and needed a DISTINCT over the whole result
+            assigned = Patient.assigned_providers.through.objects.filter(
+                patient_id=OuterRef('patient_id'), provider__wounds_user=wounds_user,
+            )
+            queryset = queryset.filter(Exists(assigned))
             
-        return queryset.distinct()
+        # Wound has no default ordering, and neither the EXISTS nor the joins give one
+        return queryset.order_by('id')
 
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent
     def create(self, request, *args, **kwargs):
         # Only Specialists should create wounds
         if not hasattr(request.user, 'wounds_user') or request.user.wounds_user.role != WoundsUser.Provider:
             return Response({"error": "Only specialists can register new wounds."}, status=status.HTTP_403_FORBIDDEN)
         return super().create(request, *args, **kwargs)
 
-    @action(detail=True, methods=['get', 'post'], url_path='observations')
+    @extend_schema(
+        methods=['GET'],
+        parameters=[
+            OpenApiParameter("since", str, description="Only observations created at or after this ISO 8601 date or datetime"),
+            OpenApiParameter("until", str, description="Only observations created before this ISO 8601 date or datetime"),
+            OpenApiParameter("only", str, description="Comma-separated fields to return (id is always included)"),
+            OpenApiParameter("cursor", str, description="The `next` link of the previous page carries it"),
+            OpenApiParameter("page_size", int, description="Default 20, at most 100. Without page_size or cursor the whole history is returned as a list"),
+        ],
+        responses={
+            200: ObservationSerializer(many=True),
+            400: OpenApiResponse(description="Invalid since/until or unknown fields in only"),
+        },
+    )
+    @extend_schema(methods=['POST'], parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @action(detail=True, methods=['get', 'post'], url_path='observations', pagination_class=ObservationKeysetPagination)
+    @idempotent
     def observations(self, request, pk=None):
         wound = self.get_object()
         
         if request.method == 'GET':
-            observations = wound.observations.all()
-            serializer = ObservationSerializer(observations, many=True, context={'request': request})
-            return Response(serializer.data)
+            try:
+                observations, fields = _observation_history(wound, request.query_params)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            page = self.paginate_queryset(observations)
+            serializer = ObservationSerializer(
+                observations if page is None else page, many=True, fields=fields, context={'request': request},
+            )
+            if page is None:
+                return Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
         
         if request.method == 'POST':
             serializer = ObservationSerializer(data=request.data, context={'request': request})
             serializer.is_valid(raise_exception=True)
+            # Stage the image for process_observation_images instead of
+            # uploading it to object storage inside the request
+            upload = serializer.validated_data.pop('image', None)
             # Link to wound and set current user as author
-            serializer.save(wound=wound, author=request.user.wounds_user)
+            observation = serializer.save(wound=wound, author=request.user.wounds_user)
+            if upload:
+                stage_upload(observation, upload)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request=ObservationSyncSerializer,
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+        responses={
+            200: OpenApiResponse(response=ObservationSyncResponseSerializer),
+            400: OpenApiResponse(description="Empty or oversized batch"),
+            409: OpenApiResponse(description="Another request is syncing the same client_id"),
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='observations/sync')
+    @idempotent
+    def sync_observations(self, request):
+        """
+        Create many observations, across wounds, in one request and one
+        transaction. Each item is validated on its own: valid ones are
+        inserted together, rejected ones come back with their errors, in the
+        order they were sent. Items whose client_id the author already synced
+        return the stored observation instead of a new one.
+        """
+        serializer = ObservationSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['observations']
+
+        requested_wounds = {item.get('wound') for item in items}
+        # One query for every wound of the batch, with the same visibility rules
+        wound_ids = set(self.get_queryset().filter(
+            pk__in=[wound for wound in requested_wounds if isinstance(wound, int)],
+        ).values_list('pk', flat=True))
+
+        author = request.user.wounds_user
+        results = []
+        valid = []
+        client_ids = set()
+        for index, item in enumerate(items):
+            item_serializer = ObservationSyncItemSerializer(data=item, context={'request': request})
+            item_serializer.is_valid()
+            errors = dict(item_serializer.errors)
+            if item.get('wound') not in wound_ids:
+                errors['wound'] = ["Wound not found."]
+            client_id = item_serializer.validated_data.get('client_id')
+            if client_id in client_ids:
+                errors['client_id'] = ["Repeated in this request."]
+            elif client_id is not None:
+                client_ids.add(client_id)
+            result = {"index": index}
+            results.append(result)
+            if errors:
+                result.update(status=status.HTTP_400_BAD_REQUEST, errors=errors)
+                continue
+            valid.append((result, item['wound'], dict(item_serializer.validated_data)))
+
+        # Items stored by an earlier sync whose response never reached the device
+        synced = {
+            observation.client_id: observation
+            for observation in Observation.objects.select_related('author__user').filter(author=author, client_id__in=client_ids)
+        } if client_ids else {}
+
+        observations = []
+        for result, wound_id, data in valid:
+            existing = synced.get(data.get('client_id'))
+            if existing is not None:
+                result.update(status=status.HTTP_200_OK, observation=existing)
+                continue
+            recorded_at = data.pop('recorded_at', None)
+            if recorded_at is not None:
+                data['created_at'] = recorded_at
+            observation = Observation(wound_id=wound_id, author=author, **data)
+            result.update(status=status.HTTP_201_CREATED, observation=observation)
+            observations.append(observation)
+
+        try:
+            with transaction.atomic():
+                Observation.objects.bulk_create(observations)
+        except IntegrityError:
+            # A concurrent sync stored one of the client_ids first; retrying returns it
+            return Response(
+                {"error": "Some of these observations are being synced by another request."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        returned = [result for result in results if "observation" in result]
+        serialized = ObservationSerializer([result["observation"] for result in returned], many=True, context={'request': request}).data
+        for result, observation in zip(returned, serialized):
+            result["observation"] = observation
+        failed = sum(result["status"] == status.HTTP_400_BAD_REQUEST for result in results)
+        return Response({"created": len(observations), "failed": failed, "results": results})
+
+    @extend_schema(
+        request=ObservationUploadSerializer,
+        responses={
+            200: OpenApiResponse(response=ObservationUploadResponseSerializer),
+            501: OpenApiResponse(description="Storage is not S3"),
+        }
+    )
+    @action(detail=True, methods=['post'], url_path='observations/upload-url')
+    def observation_upload_url(self, request, pk=None):
+        """Presigned URL to PUT an observation image directly into object storage."""
+        wound = self.get_object()
+        if not direct_uploads_enabled():
+            return Response({"error": "Direct uploads require S3 storage."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        serializer = ObservationUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(create_upload(wound, **serializer.validated_data))
+
+    @extend_schema(
+        request=ObservationUploadFinalizeSerializer,
+        responses={
+            200: OpenApiResponse(response=ObservationSerializer),
+            400: OpenApiResponse(description="Invalid token, missing or rejected upload"),
+            404: OpenApiResponse(description="Observation not found"),
+            501: OpenApiResponse(description="Storage is not S3"),
+        }
+    )
+    @action(detail=True, methods=['post'], url_path=r'observations/(?P<observation_id>\d+)/finalize-upload')
+    def finalize_observation_upload(self, request, pk=None, observation_id=None):
+        """Attach an image uploaded through observation_upload_url to an observation."""
+        wound = self.get_object()
+        if not direct_uploads_enabled():
+            return Response({"error": "Direct uploads require S3 storage."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        observation = wound.observations.filter(pk=observation_id).first()
+        if observation is None:
+            return Response({"error": "Observation not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = ObservationUploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            finalize_upload(observation, serializer.validated_data['upload_token'])
+        except InvalidUpload as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ObservationSerializer(observation, context={'request': request}).data)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "drf_spectacular",
@@ -93,9 +95,121 @@ DATABASES = {
         "PASSWORD": os.environ.get("SERVER_WOUNDS_DB_PASSWORD", "wounds"),
         "HOST": os.environ.get("SERVER_WOUNDS_DB_HOST", "localhost"),
         "PORT": os.environ.get("SERVER_WOUNDS_DB_PORT", "5432"),
+        "OPTIONS": {
+            "connect_timeout": int(os.environ.get("SERVER_WOUNDS_DB_CONNECT_TIMEOUT", "5")),
+        },
     }
 }
 
+# Connection reuse: "pool" uses psycopg's native pool (one per worker process),
+# "persistent" keeps one connection per thread for CONN_MAX_AGE seconds, and
+# "none" opens a new connection for every request.
+DB_CONNECTION_MODE = os.environ.get("SERVER_WOUNDS_DB_CONNECTION_MODE", "pool")
+
+if DB_CONNECTION_MODE == "pool":
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.environ.get("SERVER_WOUNDS_DB_POOL_MIN_SIZE", "2")),
+        "max_size": int(os.environ.get("SERVER_WOUNDS_DB_POOL_MAX_SIZE", "10")),
+        # Seconds a request waits for a free connection before failing
+        "timeout": float(os.environ.get("SERVER_WOUNDS_DB_POOL_TIMEOUT", "10")),
+        # Seconds before idle connections above min_size are closed
+        "max_idle": float(os.environ.get("SERVER_WOUNDS_DB_POOL_MAX_IDLE", "300")),
+        # Seconds before a connection is replaced, regardless of use
+        "max_lifetime": float(os.environ.get("SERVER_WOUNDS_DB_POOL_MAX_LIFETIME", "3600")),
+    }
+elif DB_CONNECTION_MODE == "persistent":
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("SERVER_WOUNDS_DB_CONN_MAX_AGE", "60"))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Server-side limit for a single statement, in milliseconds (0 disables it)
+DB_STATEMENT_TIMEOUT = int(os.environ.get("SERVER_WOUNDS_DB_STATEMENT_TIMEOUT", "30000"))
+if DB_STATEMENT_TIMEOUT:
+    DATABASES["default"]["OPTIONS"]["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# "file" is shared by every worker process on the host, "locmem" is per-process
+# (only safe with a single worker) and "redis" is shared across hosts.
+
+CACHE_BACKEND = os.environ.get("SERVER_WOUNDS_CACHE_BACKEND", "file")
+
+if CACHE_BACKEND == "redis":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("SERVER_WOUNDS_CACHE_LOCATION", "redis://localhost:6379/0"),
+        }
+    }
+elif CACHE_BACKEND == "locmem":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get(
+                "SERVER_WOUNDS_CACHE_LOCATION",
+                os.path.join(tempfile.gettempdir(), "server_wounds_cache"),
+            ),
+        }
+    }
+
+# Seconds a cached /auth/me profile may live without being invalidated
+ME_PROFILE_CACHE_TIMEOUT = int(os.environ.get("ME_PROFILE_CACHE_TIMEOUT", "300"))
+
+# Comorbidity autocomplete: serve /comorbidities/search/ from an in-process
+# index, checking at most every COMORBIDITY_INDEX_CHECK_INTERVAL seconds
+# whether the table changed (set COMORBIDITY_SEARCH_IN_MEMORY=False to query
+# PostgreSQL on every request instead)
+COMORBIDITY_SEARCH_IN_MEMORY = os.environ.get("COMORBIDITY_SEARCH_IN_MEMORY", "True").lower() in ("1", "true", "yes")
+COMORBIDITY_INDEX_CHECK_INTERVAL = float(os.environ.get("COMORBIDITY_INDEX_CHECK_INTERVAL", "30"))
+
+# Observation images: the longest side, in pixels, of each rendition stored
+# next to the original upload, and their quality
+OBSERVATION_IMAGE_RENDITIONS = {
+    "thumbnail": int(os.environ.get("OBSERVATION_THUMBNAIL_SIZE", "320")),
+    "medium": int(os.environ.get("OBSERVATION_MEDIUM_SIZE", "1280")),
+}
+OBSERVATION_RENDITION_QUALITY = int(os.environ.get("OBSERVATION_RENDITION_QUALITY", "85"))
+# Normalization of uploads: rotated upright, downscaled to at most
+# OBSERVATION_IMAGE_MAX_DIMENSION pixels (0 keeps the resolution) and
+# re-encoded as JPEG or WEBP (also used for the renditions)
+OBSERVATION_IMAGE_FORMAT = os.environ.get("OBSERVATION_IMAGE_FORMAT", "JPEG").upper()
+OBSERVATION_IMAGE_QUALITY = int(os.environ.get("OBSERVATION_IMAGE_QUALITY", "90"))
+OBSERVATION_IMAGE_MAX_DIMENSION = int(os.environ.get("OBSERVATION_IMAGE_MAX_DIMENSION", "2560"))
+# Drop EXIF (GPS position, camera serial...) and color profiles
+OBSERVATION_IMAGE_STRIP_METADATA = os.environ.get("OBSERVATION_IMAGE_STRIP_METADATA", "True").lower() in ("1", "true", "yes")
+
+# Observation uploads: "inline" processes them inside the request; "background"
+# stages them in OBSERVATION_UPLOAD_STAGING_DIR for the process_observation_images
+# command, so it needs that worker running with the same staging directory
+OBSERVATION_IMAGE_PROCESSING = os.environ.get("OBSERVATION_IMAGE_PROCESSING", "inline")
+OBSERVATION_UPLOAD_STAGING_DIR = os.environ.get(
+    "OBSERVATION_UPLOAD_STAGING_DIR", str(BASE_DIR.parent / "upload-staging")
+)
+OBSERVATION_IMAGE_WORKER_THREADS = int(os.environ.get("OBSERVATION_IMAGE_WORKER_THREADS", "4"))
+OBSERVATION_IMAGE_JOB_MAX_ATTEMPTS = int(os.environ.get("OBSERVATION_IMAGE_JOB_MAX_ATTEMPTS", "3"))
+# Seconds before a retry, multiplied by the attempts so far
+OBSERVATION_IMAGE_JOB_RETRY_DELAY = int(os.environ.get("OBSERVATION_IMAGE_JOB_RETRY_DELAY", "30"))
+# Seconds after which a job still processing is assumed lost and claimed again
+OBSERVATION_IMAGE_JOB_TIMEOUT = int(os.environ.get("OBSERVATION_IMAGE_JOB_TIMEOUT", "600"))
+
+# Direct uploads to S3 (app_cicatrizando/uploads.py): lifetime of a presigned
+# PUT URL in seconds and the largest image accepted
+OBSERVATION_UPLOAD_URL_EXPIRY = int(os.environ.get("OBSERVATION_UPLOAD_URL_EXPIRY", "900"))
+OBSERVATION_UPLOAD_MAX_BYTES = int(os.environ.get("OBSERVATION_UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+
+# Most observations accepted by one POST /wounds/observations/sync/
+OBSERVATION_SYNC_MAX_ITEMS = int(os.environ.get("OBSERVATION_SYNC_MAX_ITEMS", "500"))
+
+# Seconds a response stored for an Idempotency-Key is replayed to retries
+# (app_cicatrizando/idempotency.py)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", str(24 * 60 * 60)))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -150,6 +264,24 @@ REST_FRAMEWORK = {
 GOOGLE_OAUTH2_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID", "")
 GOOGLE_OAUTH2_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET", "")
 
+GOOGLE_OAUTH2_TOKEN_URL = os.environ.get("GOOGLE_OAUTH2_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_OAUTH2_USER_INFO_URL = os.environ.get("GOOGLE_OAUTH2_USER_INFO_URL", "https://www.googleapis.com/oauth2/v3/userinfo")
+GOOGLE_OAUTH2_CERTS_URL = os.environ.get("GOOGLE_OAUTH2_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+
+# HTTP client used for Google OAuth calls (see app_cicatrizando/google.py)
+GOOGLE_HTTP_CONNECT_TIMEOUT = float(os.environ.get("GOOGLE_HTTP_CONNECT_TIMEOUT", "3.05"))
+GOOGLE_HTTP_READ_TIMEOUT = float(os.environ.get("GOOGLE_HTTP_READ_TIMEOUT", "10"))
+GOOGLE_HTTP_RETRIES = int(os.environ.get("GOOGLE_HTTP_RETRIES", "2"))
+GOOGLE_HTTP_BACKOFF_FACTOR = float(os.environ.get("GOOGLE_HTTP_BACKOFF_FACTOR", "0.5"))
+GOOGLE_HTTP_POOL_SIZE = int(os.environ.get("GOOGLE_HTTP_POOL_SIZE", "10"))
+
+# Google ID token verification: certificates are cached for Google's max-age
+# (or GOOGLE_CERTS_DEFAULT_TTL) and refreshed in the background this many
+# seconds before they expire
+GOOGLE_CERTS_DEFAULT_TTL = int(os.environ.get("GOOGLE_CERTS_DEFAULT_TTL", "3600"))
+GOOGLE_CERTS_REFRESH_MARGIN = int(os.environ.get("GOOGLE_CERTS_REFRESH_MARGIN", "300"))
+GOOGLE_ID_TOKEN_CLOCK_SKEW = int(os.environ.get("GOOGLE_ID_TOKEN_CLOCK_SKEW", "10"))
+
 # Logging
 LOGGING = {
     "version": 1,
@@ -181,10 +313,12 @@ CORS_ALLOW_CREDENTIALS = True
 
 if DEBUG:
     CORS_ALLOW_HEADERS = list(default_headers) + [
+        "idempotency-key",
         "ngrok-skip-browser-warning",
     ]
 else:
-    CORS_ALLOW_HEADERS = list(default_headers)
+    CORS_ALLOW_HEADERS = list(default_headers) + ["idempotency-key"]
+CORS_EXPOSE_HEADERS = ["idempotent-replayed"]
 
 # CSRF — origens confiáveis para POST cross-origin
 CSRF_TRUSTED_ORIGINS = CORS_ALLOWED_ORIGINS
@@ -222,6 +356,9 @@ AWS_DEFAULT_ACL = None
 AWS_S3_VERIFY = os.environ.get("AWS_S3_VERIFY", "False").lower() == "true"
 AWS_S3_ADDRESSING_STYLE = "path"
 AWS_QUERYSTRING_AUTH = os.environ.get("AWS_QUERYSTRING_AUTH", "False").lower() == "true"
+# Endpoint put in presigned upload URLs, which browsers call directly (the
+# signature covers the host, so it cannot be rewritten afterwards)
+AWS_S3_PRESIGN_ENDPOINT_URL = os.environ.get("AWS_S3_PRESIGN_ENDPOINT_URL", AWS_S3_ENDPOINT_URL)
 
 # This ensures the browser can access images via localhost:8333
 # while Django continues to upload internally via seaweedfs-s3:8333
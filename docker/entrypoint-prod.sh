@@ -5,6 +5,8 @@ set -e
 cd /code/citizens_project
 
 python manage.py migrate --noinput
+# Recompute WoundsUser.registration_complete (False for users that existed before the column)
+python manage.py backfill_registration_complete
 python manage.py load_comorbidities
 
 # Optionally create a superuser if credentials are provided and not defaults
@@ -26,4 +28,4 @@ else:
 EOF
 fi
 
-exec gunicorn citizens_project.wsgi:application --bind 0.0.0.0:8000 --workers 2
+exec gunicorn --config /code/docker/gunicorn.conf.py
@@ -1,6 +1,9 @@
+import json
 import os
 import subprocess
 import sys
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from botocore.exceptions import ClientError
 import boto3
@@ -8,7 +11,15 @@ import boto3
 DEFAULT_SUPERUSER_USERNAME = "admin"
 DEFAULT_SUPERUSER_PASSWORD = "admin"
 ROOT_DIR = Path(__file__).resolve().parent.parent
-MANAGE = ROOT_DIR / "citizens_project" / "manage.py"
+PROJECT_DIR = ROOT_DIR / "citizens_project"
+MANAGE = PROJECT_DIR / "manage.py"
+
+# Records the timings of the last boot. Every step checks its own state (the
+# database or the S3 bucket) rather than trusting this file, so a reset
+# database or SeaweedFS volume is repaired on the next start.
+STATE_FILE = Path(os.environ.get("BOOTSTRAP_STATE_FILE", ROOT_DIR / ".bootstrap-state.json"))
+
+timings = {}
 
 
 def run_command(command):
@@ -20,13 +31,103 @@ def run_command(command):
         sys.exit(1)
 
 
+@contextmanager
+def step(name):
+    print(f"[{name}] ...")
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - started, 3)
+        print(f"[{name}] {timings[name]:.3f}s")
+
+
+def save_state(state):
+    try:
+        STATE_FILE.write_text(json.dumps(state, indent=2, sort_keys=True))
+    except OSError as e:
+        print(f"Could not write bootstrap state to {STATE_FILE}: {e}")
+
+
+def setup_django():
+    # One Django setup for every step instead of one per manage.py subprocess
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "citizens_project.settings")
+    import django
+
+    django.setup()
+
+
+def apply_migrations():
+    from django.core.management import call_command
+    from django.db import connection
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connection)
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    if not plan:
+        print("No unapplied migrations.")
+        return
+
+    print(f"Applying {len(plan)} migrations...")
+    call_command("migrate", interactive=False)
+
+
+def backfill_registration_complete():
+    from django.core.management import call_command
+
+    # registration_complete defaults to False when the column is added, so
+    # existing users would be sent back to onboarding until recomputed; the
+    # set-based recompute only writes the rows that changed
+    call_command("backfill_registration_complete")
+
+
+def load_comorbidities():
+    from django.core.management import call_command
+
+    # Returns after one query when the CSV checksum matches the last sync
+    call_command("load_comorbidities")
+
+
+def superuser_key():
+    superuser_username = os.environ.get("DJANGO_SUPERUSER_USERNAME")
+    superuser_password = os.environ.get("DJANGO_SUPERUSER_PASSWORD")
+
+    if (
+        superuser_username
+        and superuser_password
+        and superuser_username != DEFAULT_SUPERUSER_USERNAME
+        and superuser_password != DEFAULT_SUPERUSER_PASSWORD
+    ):
+        return superuser_username
+    return None
+
+
+def create_superuser(username):
+    from django.contrib.auth import get_user_model
+    from django.core.management import CommandError, call_command
+
+    if get_user_model().objects.filter(username=username).exists():
+        print("Superuser already exists.")
+        return
+
+    print("Creating superuser...")
+    try:
+        # Reads DJANGO_SUPERUSER_USERNAME / _EMAIL / _PASSWORD
+        call_command("createsuperuser", interactive=False)
+        print("Superuser process finished.")
+    except CommandError as e:
+        print(f"Error creating superuser: {e}")
+
+
+def s3_bucket_configured():
+    return bool(os.environ.get("AWS_S3_ENDPOINT_URL") and os.environ.get("AWS_STORAGE_BUCKET_NAME"))
+
+
 def init_s3_bucket():
     endpoint_url = os.environ.get("AWS_S3_ENDPOINT_URL")
     bucket_name = os.environ.get("AWS_STORAGE_BUCKET_NAME")
 
-    if not endpoint_url or not bucket_name:
-        return
-
     print(f"[S3] Initializing bucket: {bucket_name}...")
     s3 = boto3.client(
         "s3",
@@ -36,6 +137,16 @@ def init_s3_bucket():
         region_name=os.environ.get("AWS_S3_REGION_NAME", "us-east-1"),
     )
 
+    try:
+        s3.head_bucket(Bucket=bucket_name)
+        print(f"Bucket {bucket_name} already exists.")
+        return True
+    except ClientError:
+        pass
+    except Exception as e:
+        print(f"Unexpected error during S3 init: {e}")
+        return False
+
     try:
         kwargs = {"Bucket": bucket_name}
         region_name = os.environ.get("AWS_S3_REGION_NAME", "us-east-1")
@@ -44,53 +155,82 @@ def init_s3_bucket():
 
         s3.create_bucket(**kwargs)
         print(f"Bucket {bucket_name} created successfully.")
+        return True
     except ClientError as e:
         error_code = e.response.get("Error", {}).get("Code")
         if error_code in ("BucketAlreadyExists", "BucketAlreadyOwnedByYou"):
             print(f"Bucket {bucket_name} already exists.")
-        else:
-            print(f"Error initializing S3: {e}")
+            return True
+        print(f"Error initializing S3: {e}")
     except Exception as e:
         print(f"Unexpected error during S3 init: {e}")
+    return False
 
 
-def main():
-    print("Starting entrypoint...")
+def close_database_connections():
+    # The server runs in another process; do not keep this one's connections
+    # (or pool) open for its whole lifetime
+    from django.db import connections
 
-    print("Applying migrations...")
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+        if conn.vendor == "postgresql":
+            conn.close_pool()
 
-    run_command(["python", str(MANAGE), "migrate", "--noinput"])
 
-    print("Loading Comorbidities")
-    run_command(["python", str(MANAGE), "load_comorbidities"])
+def bootstrap():
+    started = time.perf_counter()
 
-    print("Collecting static files...")
-    # run_command(["python", manage, "collectstatic", "--noinput"])
+    with step("django setup"):
+        setup_django()
 
-    superuser_username = os.environ.get("DJANGO_SUPERUSER_USERNAME")
-    superuser_password = os.environ.get("DJANGO_SUPERUSER_PASSWORD")
+    # Migrations, registration status, comorbidities and the superuser are
+    # checked with database queries, each cheap when there is nothing to do
+    with step("migrations"):
+        apply_migrations()
 
-    if (
-        superuser_username
-        and superuser_password
-        and superuser_username != DEFAULT_SUPERUSER_USERNAME
-        and superuser_password != DEFAULT_SUPERUSER_PASSWORD
-    ):
-        print("Checking/Creating superuser...")
-        try:
-            subprocess.run(["python", str(MANAGE), "createsuperuser", "--noinput"], check=True)
-            print("Superuser process finished.")
-        except subprocess.CalledProcessError:
-            pass
+    with step("registration status"):
+        backfill_registration_complete()
+
+    with step("comorbidities"):
+        load_comorbidities()
+
+    username = superuser_key()
+    if username:
+        with step("superuser"):
+            create_superuser(username)
+
+    # One HEAD request when the bucket exists; recreated if the volume was reset
+    if s3_bucket_configured():
+        with step("s3 bucket"):
+            init_s3_bucket()
+
+    close_database_connections()
 
-    init_s3_bucket()
+    timings["total"] = round(time.perf_counter() - started, 3)
+    save_state({"last_boot": {"at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "timings": timings}})
+    print("Boot timings: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()))
+
+
+def main():
+    print("Starting entrypoint...")
+
+    bootstrap()
+
+    print("Collecting static files...")
+    # run_command(["python", manage, "collectstatic", "--noinput"])
 
     if len(sys.argv) > 1:
         print(f"Executing: {' '.join(sys.argv[1:])}")
         os.execvp(sys.argv[1], sys.argv[1:])
 
+    # SERVER_MODE=gunicorn serves like production (see docker/gunicorn.conf.py)
+    if os.environ.get("SERVER_MODE", "runserver") == "gunicorn":
+        config = Path(__file__).resolve().parent / "gunicorn.conf.py"
+        os.execvp("gunicorn", ["gunicorn", "--config", str(config)])
+
     run_command(["python", str(MANAGE), "runserver", "0.0.0.0:8000"])
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
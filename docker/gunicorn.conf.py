@@ -0,0 +1,119 @@
+"""
+Gunicorn configuration for the production server, driven by environment
+variables (see .env.model):
+
+- GUNICORN_WORKER_CLASS: sync (default), gthread or uvicorn. uvicorn serves
+  citizens_project.asgi through uvicorn workers, which is what makes the
+  async Google login (/auth/google/async/) non-blocking.
+- GUNICORN_WORKERS: defaults from the CPUs the container may use (its
+  cgroup quota and CPU affinity, not the host's count): 2 x CPUs + 1 for
+  sync, CPUs + 1 for gthread, CPUs for uvicorn, at most MAX_DEFAULT_WORKERS.
+  Set it to run more.
+- GUNICORN_THREADS: threads per gthread worker.
+- GUNICORN_PRELOAD: import the app once in the master so workers share its
+  memory copy-on-write.
+- GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER: recycle workers to
+  bound memory growth.
+- GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_KEEPALIVE, GUNICORN_BIND.
+
+Keep workers x SERVER_WOUNDS_DB_POOL_MAX_SIZE below PostgreSQL's max_connections.
+"""
+
+import math
+import os
+import sys
+from pathlib import Path
+
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    # uvicorn.workers is deprecated in favour of the uvicorn-worker package
+    "uvicorn": "uvicorn_worker.UvicornWorker",
+}
+# Each worker holds its own database connections (and psycopg pool), so the
+# default stays small however large the node is
+MAX_DEFAULT_WORKERS = 8
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+def _cgroup_cpu_quota():
+    # cgroup v2 ("<quota> <period>" or "max <period>"), then cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+    """CPUs this process may use: its affinity, bounded by the container's CPU quota."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def default_workers(worker_model, cpus):
+    if worker_model == "sync":
+        workers = 2 * cpus + 1
+    elif worker_model == "gthread":
+        workers = cpus + 1
+    else:
+        workers = cpus
+    return min(workers, MAX_DEFAULT_WORKERS)
+
+
+worker_model = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+if worker_model not in WORKER_CLASSES:
+    sys.exit(f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, not {worker_model!r}")
+
+chdir = str(Path(__file__).resolve().parent.parent / "citizens_project")
+wsgi_app = "citizens_project.asgi:application" if worker_model == "uvicorn" else "citizens_project.wsgi:application"
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = WORKER_CLASSES[worker_model]
+workers = _env_int("GUNICORN_WORKERS", default_workers(worker_model, available_cpus()))
+threads = _env_int("GUNICORN_THREADS", 4) if worker_model == "gthread" else 1
+
+preload_app = _env_bool("GUNICORN_PRELOAD", "True")
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 100)
+
+timeout = _env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    # With preload_app the master imported Django; make sure no database
+    # connection, or psycopg pool (SERVER_WOUNDS_DB_CONNECTION_MODE=pool),
+    # opened during import is shared by the forked workers. Each worker
+    # opens its own pool on its first query.
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+        if conn.vendor == "postgresql":
+            conn.close_pool()